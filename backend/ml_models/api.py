@@ -1,18 +1,104 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import pandas as pd
 import numpy as np
-import joblib, os
+from numpy.lib.stride_tricks import sliding_window_view
+import os
+import json
+import time
 from datetime import datetime, timedelta
-from sklearn.model_selection import train_test_split, RandomizedSearchCV
+from sklearn.model_selection import train_test_split, RandomizedSearchCV, TimeSeriesSplit
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingRandomSearchCV)
+from sklearn.model_selection import HalvingRandomSearchCV
 from xgboost import XGBRegressor
 from sklearn.multioutput import MultiOutputRegressor # <-- Required for Direct model
+from model_store import ModelRegistry
+from feature_store import FeatureStore
+from forecast_cache import ForecastCache
+from stage_metrics import metrics
+from train_jobs import TrainingJobs, report_progress
 
 app = Flask(__name__)
 
 # --- We now have two models to save ---
 MODEL_PATH_RECURSIVE = "recursive_sprinter_model.pkl"
 MODEL_PATH_DIRECT = "direct_marathoner_model.pkl"
+# --- Global cross-SKU models (one pair for the whole catalogue) ---
+MODEL_PATH_GLOBAL_RECURSIVE = "global_recursive_model.pkl"
+MODEL_PATH_GLOBAL_DIRECT = "global_direct_model.pkl"
+MODEL_PATH_GLOBAL_ENCODERS = "global_encoders.pkl"
+# Versioned file names of the current model sets (see ModelRegistry.publish)
+MODEL_MANIFEST = "demand_models.json"
+MODEL_MANIFEST_GLOBAL = "global_models.json"
 FORECAST_HORIZON = 30 # Define our 30-day target
+LAGS = [1, 3, 7, 14]
+ROLLING_WINDOWS = [3, 7, 14, 30]
+EWM_SPAN = 7
+# Days of history the recursive features look back over
+HISTORY_CAPACITY = max(LAGS + ROLLING_WINDOWS)
+# Shortest series that yields at least one complete feature row
+MIN_HISTORY = HISTORY_CAPACITY + 1
+# Per-product window state, so repeat forecasts only process new days
+FEATURE_STORE_PATH = "demand_feature_store.sqlite"
+# Per-product forecasts reused while history, horizon and models are unchanged
+FORECAST_CACHE_MAX_ENTRIES = 10000
+FORECAST_CACHE_TTL_SECONDS = 300
+
+# Recursive model hyperparameter search: "randomized" (RandomizedSearchCV),
+# "halving" (successive halving on time-ordered folds + early stopping) or
+# "saved" (refit with the params the last search saved)
+RECURSIVE_SEARCHES = ("randomized", "halving", "saved")
+RECURSIVE_PARAMS_PATH = "recursive_sprinter_params.json"
+GLOBAL_RECURSIVE_PARAMS_PATH = "global_recursive_params.json"
+# Share of the most recent rows held out for early stopping
+VALIDATION_FRACTION = 0.2
+# XGBoost threads per fit; the search runs cores // this many fits at once
+XGB_THREADS_PER_FIT = 4
+
+# Direct model engines: "multioutput" wraps one XGBoost model per horizon day,
+# "native" is a single booster with one leaf vector per tree (multi_output_tree)
+DIRECT_ENGINES = ("multioutput", "native")
+
+# "series" models are trained on one history by /train, the "global" ones on
+# many SKUs at once by /train/global
+DEMAND_MODELS = ("series", "global")
+# Static per-series features the global models see in addition to create_features
+SERIES_FEATURES = ["product_code", "category_code", "series_scale"]
+
+# Job records shared by every server process (see serve.py)
+TRAINING_JOBS_PATH = "training_jobs.sqlite"
+# XGBoost threads per predict call; serve.py sets this to cores // workers so
+# concurrent workers do not oversubscribe the CPU. None keeps the trained value
+PREDICT_THREADS = None
+
+
+def pin_predict_threads(models):
+    """Set the predict thread count of freshly loaded models, in place"""
+    if PREDICT_THREADS is None:
+        return
+    for model in models.values():
+        if isinstance(model, MultiOutputRegressor):
+            # The wrapper predicts its estimators one after another
+            model.n_jobs = 1
+            for estimator in getattr(model, "estimators_", []):
+                estimator.set_params(n_jobs=PREDICT_THREADS)
+        elif isinstance(model, XGBRegressor):
+            model.set_params(n_jobs=PREDICT_THREADS)
+
+# Both models live in memory and are swapped together when /train publishes
+# new ones, in this or any other worker process
+demand_models = ModelRegistry({
+    "recursive": MODEL_PATH_RECURSIVE,
+    "direct": MODEL_PATH_DIRECT
+}, MODEL_MANIFEST, on_load=pin_predict_threads)
+global_demand_models = ModelRegistry({
+    "recursive": MODEL_PATH_GLOBAL_RECURSIVE,
+    "direct": MODEL_PATH_GLOBAL_DIRECT,
+    "encoders": MODEL_PATH_GLOBAL_ENCODERS
+}, MODEL_MANIFEST_GLOBAL, on_load=pin_predict_threads)
+feature_store = FeatureStore(FEATURE_STORE_PATH, capacity=HISTORY_CAPACITY, ewm_span=EWM_SPAN)
+forecast_cache = ForecastCache(max_entries=FORECAST_CACHE_MAX_ENTRIES, ttl_seconds=FORECAST_CACHE_TTL_SECONDS)
+# /train and /train/global run here, one job per model ("series", "global")
+training_jobs = TrainingJobs(TRAINING_JOBS_PATH, max_workers=len(DEMAND_MODELS))
 
 
 # ---------- 1. FEATURE ENGINEERING (Unchanged from v4/v5) ----------
@@ -34,133 +120,595 @@ def create_features(df):
     
     df["quantity_sold_deviation"] = df["quantity_sold"] - df["seasonal_avg"]
 
-    for lag in [1, 3, 7, 14]:
+    for lag in LAGS:
         df[f"lag_{lag}"] = df["quantity_sold"].shift(lag)
 
-    for window in [3, 7, 14, 30]:
+    for window in ROLLING_WINDOWS:
         df[f"rolling_mean_{window}"] = df["quantity_sold"].shift(1).rolling(window=window).mean()
         df[f"rolling_std_{window}"] = df["quantity_sold"].shift(1).rolling(window=window).std()
 
-    df["ewm_mean_7"] = df["quantity_sold"].shift(1).ewm(span=7).mean()
+    df[f"ewm_mean_{EWM_SPAN}"] = df["quantity_sold"].shift(1).ewm(span=EWM_SPAN).mean()
 
     df = df.dropna().reset_index(drop=True)
     return df
 
 
-# ---------- 2. MODEL A: RECURSIVE "SPRINTER" (v4) ----------
-def train_recursive_model(df):
+def create_features_batch(df):
     """
-    (v4 Logic) Trains a single model to predict Day+1's deviation.
+    create_features for many series in one frame.
+
+    df has a 'product_id' column and each product's rows in date order. Every
+    feature is computed within its own product (grouped shifts, rolling
+    windows and EWM), so each product's rows match create_features on that
+    series alone.
     """
-    print("--- Training Model A (Recursive Sprinter) ---")
-    features = [
-        col for col in df.columns if col not in [
-            "date", "quantity_sold", "seasonal_avg", "quantity_sold_deviation"
+    df = df.copy()
+    df["month"] = df["date"].dt.month
+    df["day_of_week"] = df["date"].dt.dayofweek
+    df["day_of_year"] = df["date"].dt.dayofyear
+    df["is_weekend"] = (df["day_of_week"] >= 5).astype(int)
+    df["sin_dayofyear"] = np.sin(2 * np.pi * df["day_of_year"] / 365)
+    df["cos_dayofyear"] = np.cos(2 * np.pi * df["day_of_year"] / 365)
+
+    by_product = df.groupby("product_id", sort=False)
+    df["time_index"] = by_product.cumcount()
+
+    df["seasonal_avg"] = df.groupby(["product_id", "day_of_week"])["quantity_sold"].transform("mean")
+    df["quantity_sold_deviation"] = df["quantity_sold"] - df["seasonal_avg"]
+
+    for lag in LAGS:
+        df[f"lag_{lag}"] = by_product["quantity_sold"].shift(lag)
+
+    shifted = by_product["quantity_sold"].shift(1).groupby(df["product_id"], sort=False)
+    for window in ROLLING_WINDOWS:
+        rolling = shifted.rolling(window=window)
+        df[f"rolling_mean_{window}"] = rolling.mean().reset_index(level=0, drop=True)
+        df[f"rolling_std_{window}"] = rolling.std().reset_index(level=0, drop=True)
+
+    df[f"ewm_mean_{EWM_SPAN}"] = shifted.ewm(span=EWM_SPAN).mean().reset_index(level=0, drop=True)
+
+    df = df.dropna().reset_index(drop=True)
+    return df
+
+
+def _feature_columns(df_processed):
+    return [
+        col for col in df_processed.columns if col not in [
+            "product_id", "date", "quantity_sold", "seasonal_avg", "quantity_sold_deviation"
         ]
     ]
+
+
+def scale_series(series):
+    """
+    Divide each series by its mean daily quantity so all SKUs share one scale.
+
+    Returns the scaled {product_id: DataFrame} and the (P,) scales; a series
+    without sales keeps a scale of 1.
+    """
+    scales = np.array([df["quantity_sold"].mean() for df in series.values()], dtype=np.float64)
+    scales = np.where(scales > 0, scales, 1.0)
+    scaled = {
+        product_id: df.assign(quantity_sold=df["quantity_sold"] / scale)
+        for (product_id, df), scale in zip(series.items(), scales)
+    }
+    return scaled, scales
+
+
+def fit_series_encoders(series, categories):
+    """Integer codes for the product ids and categories seen in training"""
+    category_names = {str(c) for c in categories.values() if c is not None}
+    return {
+        "products": {product_id: code for code, product_id in enumerate(sorted(map(str, series)))},
+        "categories": {category: code for code, category in enumerate(sorted(category_names))}
+    }
+
+
+def series_features(series, categories, encoders, scales):
+    """
+    The SERIES_FEATURES of the global models, one row per product.
+
+    Products and categories unknown to the encoders are NaN, which XGBoost
+    treats as missing.
+    """
+    def code(mapping, key):
+        return mapping.get(str(key), np.nan) if key is not None else np.nan
+
+    return pd.DataFrame({
+        "product_code": [code(encoders["products"], pid) for pid in series],
+        "category_code": [code(encoders["categories"], categories.get(pid)) for pid in series],
+        "series_scale": np.log1p(scales)
+    }, columns=SERIES_FEATURES)
+
+
+def stacked_features(series, static=None):
+    """
+    create_features_batch over {product_id: raw DataFrame}.
+
+    Products are numbered 0..P-1 in dict order in the 'product_id' column.
+    Columns of static (one row per product) are appended to every row.
+    """
+    frames = list(series.values())
+    stacked = pd.concat(frames, ignore_index=True)
+    stacked.insert(0, "product_id", np.repeat(np.arange(len(frames)), [len(f) for f in frames]))
+    processed = create_features_batch(stacked)
+    if static is not None:
+        product_rows = processed["product_id"].to_numpy()
+        for name in static.columns:
+            processed[name] = static[name].to_numpy(dtype=np.float64)[product_rows]
+    return processed
+
+
+# ---------- 2. MODEL A: RECURSIVE "SPRINTER" (v4) ----------
+def _core_split():
+    """
+    (search workers, XGBoost threads per fit) that together use each core once.
+
+    Running n_jobs=-1 in both the search and XGBoost starts cores^2 threads.
+    """
+    cores = os.cpu_count() or 1
+    xgb_threads = min(XGB_THREADS_PER_FIT, cores)
+    return max(1, cores // xgb_threads), xgb_threads
+
+
+def load_search_params(params_path):
+    """Best params saved by an earlier search, or None"""
+    if not os.path.exists(params_path):
+        return None
+    with open(params_path) as f:
+        return json.load(f)["params"]
+
+
+def save_search_params(params_path, params, search, best_score):
+    tmp_path = f"{params_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "params": params,
+            "search": search,
+            "best_score": best_score,
+            "saved_at": datetime.now().isoformat()
+        }, f, indent=2)
+    os.replace(tmp_path, params_path)
+
+
+def train_recursive_model(df, search="randomized", params_path=RECURSIVE_PARAMS_PATH):
+    """
+    (v4 Logic) Trains a single model to predict Day+1's deviation.
+
+    search="randomized" is the original RandomizedSearchCV. search="halving"
+    runs successive halving over the number of trees on TimeSeriesSplit
+    folds, then picks the final tree count by early stopping on the most
+    recent VALIDATION_FRACTION of rows. search="saved" refits with the params
+    from params_path (falling back to "halving" if there are none). Every
+    search saves its best params to params_path.
+    """
+    print(f"--- Training Model A (Recursive Sprinter, {search} search) ---")
+    if search not in RECURSIVE_SEARCHES:
+        raise ValueError(f"Unknown search '{search}'. Use one of {list(RECURSIVE_SEARCHES)}.")
+    if "date" in df:
+        # Time order for the splits (stacked global frames are product-major)
+        df = df.iloc[np.argsort(df["date"].to_numpy(), kind="stable")]
+    features = _feature_columns(df)
     X = df[features]
     y = df["quantity_sold_deviation"] # Target is a single value
+    search_jobs, xgb_threads = _core_split()
+
+    if search == "saved":
+        params = load_search_params(params_path)
+        if params is not None:
+            print(f"Reusing saved params from {params_path}: {params}")
+            model = XGBRegressor(objective="reg:squarederror", random_state=42, n_jobs=xgb_threads, **params)
+            return model.fit(X, y)
+        search = "halving"
 
-    # Using RandomizedSearch to find a good simple model
+    if search == "randomized":
+        # Using RandomizedSearch to find a good simple model
+        param_dist = {
+            "n_estimators": [300, 500, 800],
+            "max_depth": [4, 6, 8],
+            "learning_rate": [0.01, 0.05, 0.1]
+        }
+        model = XGBRegressor(objective="reg:squarederror", random_state=42, n_jobs=xgb_threads)
+        searcher = RandomizedSearchCV(
+            model, param_distributions=param_dist, n_iter=10, cv=3,
+            scoring="neg_mean_absolute_error", n_jobs=search_jobs, random_state=42,
+        )
+        searcher.fit(X, y)
+        save_search_params(params_path, searcher.best_params_, search, float(searcher.best_score_))
+        return searcher.best_estimator_
+
+    # Successive halving: every candidate gets a few trees, the best third
+    # three times as many, and so on; folds respect time order
     param_dist = {
-        "n_estimators": [300, 500, 800],
-        "max_depth": [4, 6, 8],
-        "learning_rate": [0.01, 0.05, 0.1]
+        "max_depth": [3, 4, 6, 8],
+        "learning_rate": [0.01, 0.03, 0.05, 0.1],
+        "subsample": [0.7, 0.85, 1.0],
+        "colsample_bytree": [0.7, 0.85, 1.0],
+        "min_child_weight": [1, 3, 5]
     }
-    model = XGBRegressor(objective="reg:squarederror", random_state=42, n_jobs=-1)
-    search = RandomizedSearchCV(
-        model, param_distributions=param_dist, n_iter=10, cv=3,
-        scoring="neg_mean_absolute_error", n_jobs=-1, random_state=42,
+    model = XGBRegressor(objective="reg:squarederror", random_state=42, n_jobs=xgb_threads)
+    searcher = HalvingRandomSearchCV(
+        model, param_distributions=param_dist, n_candidates=27, factor=3,
+        resource="n_estimators", min_resources=50, max_resources=800,
+        cv=TimeSeriesSplit(n_splits=3), scoring="neg_mean_absolute_error",
+        n_jobs=search_jobs, random_state=42, refit=False
     )
-    search.fit(X, y)
-    return search.best_estimator_
+    searcher.fit(X, y)
+    params = {k: v for k, v in searcher.best_params_.items() if k != "n_estimators"}
 
-def forecast_recursive(df, model, days_to_forecast):
+    # Final tree count by early stopping on the most recent rows
+    n_val = max(1, int(len(X) * VALIDATION_FRACTION))
+    model = XGBRegressor(
+        objective="reg:squarederror", random_state=42, n_jobs=xgb_threads,
+        n_estimators=800, early_stopping_rounds=50, **params
+    )
+    model.fit(X.iloc[:-n_val], y.iloc[:-n_val], eval_set=[(X.iloc[-n_val:], y.iloc[-n_val:])], verbose=False)
+    params["n_estimators"] = int(model.best_iteration) + 1
+    print(f"Halving search picked {params} (best CV score {searcher.best_score_:.4f})")
+    save_search_params(params_path, params, search, float(searcher.best_score_))
+
+    # Refit on all rows with the chosen number of trees
+    model = XGBRegressor(objective="reg:squarederror", random_state=42, n_jobs=xgb_threads, **params)
+    return model.fit(X, y)
+
+
+class SalesHistory:
     """
-    (v4 Logic) Predicts 30 days ahead using a recursive loop.
+    Fixed-size ring buffer over the tails of one or more sales series, plus EWM state.
+
+    Rows are series. Each step is written twice (at pos and pos + capacity),
+    so the last n values of every row are one contiguous (rows, n) slice.
+    Appending a step is O(1) per series; the EWM follows the same recursion
+    as pandas ewm(span=EWM_SPAN, adjust=True) over each full series, so
+    results match the DataFrame version exactly. Series shorter than the
+    capacity are NaN-padded on the left.
+
+    tails are the series (or at least their last capacity values); ewm and
+    ewm_weight are the EWM state after each full series (see _ewm_state).
     """
-    print("--- Running Model A (Recursive Sprinter) ---")
-    historical_df_processed = create_features(df.copy())
-    seasonal_anchors = historical_df_processed.groupby("day_of_week")["seasonal_avg"].first().to_dict()
-    global_mean_anchor = historical_df_processed["seasonal_avg"].mean() 
-    
-    forecast_df = df.copy() # Use raw history to append to
-    
-    features = [
-        col for col in historical_df_processed.columns if col not in [
-            "date", "quantity_sold", "seasonal_avg", "quantity_sold_deviation"
-        ]
-    ]
-    
-    last_date = forecast_df["date"].max()
-    predictions = []
-    temp_df_mean = historical_df_processed[features].mean() # For filling NaNs
+    def __init__(self, tails, capacity, ewm, ewm_weight):
+        self.capacity = capacity
+        self.buffer = np.full((len(tails), 2 * capacity), np.nan)
+        self.pos = 0
+        for row, values in enumerate(tails):
+            tail = values[-capacity:]
+            self.buffer[row, capacity - len(tail):capacity] = tail
+            self.buffer[row, 2 * capacity - len(tail):] = tail
+
+        self.ewm_decay = 1.0 - 2.0 / (EWM_SPAN + 1)
+        self.ewm = np.array(ewm, dtype=np.float64)
+        self.ewm_weight = np.array(ewm_weight, dtype=np.float64)
+
+    def append(self, values):
+        self.buffer[:, self.pos] = values
+        self.buffer[:, self.pos + self.capacity] = values
+        self.pos = (self.pos + 1) % self.capacity
+
+        self.ewm_weight = self.ewm_weight * self.ewm_decay
+        updated = (self.ewm_weight * self.ewm + values) / (self.ewm_weight + 1.0)
+        self.ewm = np.where(self.ewm != values, updated, self.ewm)
+        self.ewm_weight = self.ewm_weight + 1.0
+
+    def tail(self, n):
+        """The last n values of every series, oldest first"""
+        n = min(n, self.capacity)
+        end = self.pos + self.capacity
+        return self.buffer[:, end - n:end]
+
+    def lag(self, k):
+        return self.buffer[:, self.pos + self.capacity - k]
+
+
+def _ewm_state(series):
+    """
+    EWM mean and adjust=True weight after each full series.
+
+    The means come from pandas; the weight only depends on the series length.
+    """
+    decay = 1.0 - 2.0 / (EWM_SPAN + 1)
+    lengths = np.array([len(values) for values in series])
+    ids = np.repeat(np.arange(len(series)), lengths)
+    ewm = pd.Series(np.concatenate(series)).groupby(ids).ewm(span=EWM_SPAN).mean().to_numpy()
+    weights = [1.0]
+    for _ in range(lengths.max() - 1):
+        weights.append(weights[-1] * decay + 1.0)
+    return ewm[np.cumsum(lengths) - 1], np.array(weights)[lengths - 1]
+
+
+def _window_mean_std(window):
+    """Row-wise mean and sample std computed the same way as pandas Series.mean()/.std()"""
+    count = window.shape[1]
+    mean = window.sum(axis=1) / count
+    if count < 2:
+        return mean, np.full(len(window), np.nan)
+    std = np.sqrt(((mean[:, None] - window) ** 2).sum(axis=1) / (count - 1))
+    return mean, std
+
+
+def _stack_series(series, static=None):
+    """
+    Features for {product_id: raw DataFrame} built as one frame.
+
+    Returns the processed frame (see stacked_features), each product's last
+    processed row index, and per product the (7,) seasonal anchors by day of
+    week, the fallback anchor and the NaN fill values, computed exactly as
+    the single-series code computed them.
+    """
+    frames = list(series.values())
+    processed = stacked_features(series, static)
+
+    features = _feature_columns(processed)
+    counts = np.bincount(processed["product_id"].to_numpy(), minlength=len(frames))
+    if (counts == 0).any():
+        short = [pid for pid, count in zip(series, counts) if count == 0]
+        raise ValueError(f"Not enough history for {short}: need at least {MIN_HISTORY} days.")
+    ends = np.cumsum(counts)
+    starts = ends - counts
+
+    anchors = np.full((len(frames), 7), np.nan)
+    first = processed.groupby(["product_id", "day_of_week"])["seasonal_avg"].first()
+    anchors[first.index.get_level_values(0), first.index.get_level_values(1)] = first.to_numpy()
+
+    seasonal_avg = processed["seasonal_avg"].to_numpy()
+    values = processed[features].to_numpy(dtype=np.float64)
+    global_anchors = np.empty(len(frames))
+    fill_values = np.empty((len(frames), len(features)))
+    for p, (start, end) in enumerate(zip(starts, ends)):
+        global_anchors[p] = seasonal_avg[start:end].mean()
+        fill_values[p] = np.ascontiguousarray(values[start:end].T).sum(axis=1) / (end - start)
+    anchors = np.where(np.isnan(anchors), global_anchors[:, None], anchors)
+
+    return processed, features, ends - 1, anchors, fill_values
+
+
+def feature_names(static_columns=()):
+    """Feature columns in create_features order, followed by any static columns"""
+    names = ["month", "day_of_week", "day_of_year", "is_weekend",
+             "sin_dayofyear", "cos_dayofyear", "time_index"]
+    names += [f"lag_{lag}" for lag in LAGS]
+    for window in ROLLING_WINDOWS:
+        names += [f"rolling_mean_{window}", f"rolling_std_{window}"]
+    names.append(f"ewm_mean_{EWM_SPAN}")
+    return names + list(static_columns)
+
+
+def _series_context(series, static=None):
+    """
+    Everything both forecasters need about a batch of raw series.
+
+    One create_features_batch pass serves the recursive and the direct model.
+    """
+    processed, features, last_rows, anchors, fill_values = _stack_series(series, static)
+    values = [df["quantity_sold"].to_numpy(dtype=np.float64) for df in series.values()]
+    ewm, ewm_weight = _ewm_state(values)
+    return {
+        "product_ids": list(series),
+        "features": features,
+        "anchors": anchors,
+        "fill_values": fill_values,
+        "last_dates": pd.DatetimeIndex([df["date"].max() for df in series.values()]),
+        "history_lengths": np.array([len(values_p) for values_p in values]),
+        "tails": [values_p[-HISTORY_CAPACITY:] for values_p in values],
+        "ewm": ewm,
+        "ewm_weight": ewm_weight,
+        "X_last": processed[features].iloc[last_rows]
+    }
+
+
+def _store_context(states, static=None, scales=None):
+    """
+    The same context as _series_context, from FeatureStore states.
+
+    Nothing is recomputed over the history: the last feature row, the ring
+    buffer and the seasonal anchors all come from the stored window state.
+    Results match the full rebuild up to floating-point rounding.
+    """
+    product_ids = list(states)
+    states = list(states.values())
+    features = feature_names(static.columns if static is not None else ())
+    scale = scales[:, None] if scales is not None else 1.0
+
+    counts = np.array([state["count"] for state in states])
+    if (counts < MIN_HISTORY).any():
+        short = [pid for pid, count in zip(product_ids, counts) if count < MIN_HISTORY]
+        raise ValueError(f"Not enough history for {short}: need at least {MIN_HISTORY} days.")
+    tails = np.array([state["tail"] for state in states]) / scale
+    last_dates = pd.DatetimeIndex([state["last_date"] for state in states])
+    last_day_of_week = last_dates.dayofweek.to_numpy()
+
+    # Seasonal anchors: day-of-week means over the whole history. Days of
+    # week without a complete feature row fall back to the mean anchor of
+    # the rows that have one, as in _stack_series.
+    seasonal_avg = (np.array([state["dow_sum"] for state in states])
+                    / np.maximum(np.array([state["dow_count"] for state in states]), 1) / scale)
+    feature_rows = counts - HISTORY_CAPACITY
+    offsets = (last_day_of_week[:, None] - np.arange(7)) % 7
+    rows_per_day = np.zeros((len(states), 7))
+    np.put_along_axis(
+        rows_per_day, offsets,
+        feature_rows[:, None] // 7 + (np.arange(7) < feature_rows[:, None] % 7), axis=1
+    )
+    global_anchors = (rows_per_day * seasonal_avg).sum(axis=1) / feature_rows
+    anchors = np.where(rows_per_day > 0, seasonal_avg, global_anchors[:, None])
+
+    # Features of the last day of history
+    day_of_year = last_dates.dayofyear.to_numpy()
+    X_last = pd.DataFrame(index=range(len(states)), columns=features, dtype=np.float64)
+    X_last["month"] = last_dates.month
+    X_last["day_of_week"] = last_day_of_week
+    X_last["day_of_year"] = day_of_year
+    X_last["is_weekend"] = (last_day_of_week >= 5).astype(int)
+    X_last["sin_dayofyear"] = np.sin(2 * np.pi * day_of_year / 365)
+    X_last["cos_dayofyear"] = np.cos(2 * np.pi * day_of_year / 365)
+    X_last["time_index"] = counts - 1
+    for lag in LAGS:
+        X_last[f"lag_{lag}"] = tails[:, -1 - lag]
+    for window in ROLLING_WINDOWS:
+        mean, std = _window_mean_std(tails[:, -1 - window:-1])
+        X_last[f"rolling_mean_{window}"] = mean
+        X_last[f"rolling_std_{window}"] = std
+    ewm_before_last = np.array([state["ewm_before_last"] for state in states], dtype=np.float64)
+    X_last[f"ewm_mean_{EWM_SPAN}"] = ewm_before_last / np.ravel(scale)
+    if static is not None:
+        for name in static.columns:
+            X_last[name] = static[name].to_numpy(dtype=np.float64)
+
+    return {
+        "product_ids": product_ids,
+        "features": features,
+        "anchors": anchors,
+        "fill_values": np.full((len(states), len(features)), np.nan),
+        "last_dates": last_dates,
+        "history_lengths": counts,
+        "tails": tails[:, -HISTORY_CAPACITY:],
+        "ewm": np.array([state["ewm"] for state in states]) / np.ravel(scale),
+        "ewm_weight": np.array([state["ewm_weight"] for state in states]),
+        "X_last": X_last
+    }
+
+
+def _forecast_frame(context, predicted):
+    """
+    Forecasts as arrays: the product ids, each product's last history date
+    and a (P, days) float array of predictions for the days that follow.
+    """
+    return {"product_ids": context["product_ids"], "last_dates": context["last_dates"], "predicted": predicted}
+
+
+def _forecast_records(frame):
+    """{product_id: [{date, predicted_quantity}, ...]} for the response; the only place values are rounded"""
+    with metrics.stage("forecast.serialize"):
+        days = frame["predicted"].shape[1]
+        dates = frame["last_dates"].to_numpy(dtype="datetime64[D]")[:, None] + np.arange(1, days + 1)
+        return {
+            product_id: [
+                {"date": date, "predicted_quantity": round(value, 2)}
+                for date, value in zip(np.datetime_as_string(dates[p]).tolist(), frame["predicted"][p].tolist())
+            ]
+            for p, product_id in enumerate(frame["product_ids"])
+        }
+
+
+def forecast_recursive_batch(series, model, days_to_forecast, static=None, scales=None, context=None):
+    """
+    (v4 Logic) Recursive forecasts for many series at once.
+
+    series maps product id -> raw DataFrame (date, quantity_sold). Every
+    horizon step builds one feature row per product and makes a single
+    model.predict call for the whole batch. For the global model, static
+    holds the per-product SERIES_FEATURES and predictions are multiplied
+    back by scales. A precomputed context (_series_context/_store_context)
+    replaces series. Returns a forecast frame (see _forecast_frame).
+    """
+    if context is None:
+        with metrics.stage("forecast.features"):
+            context = _series_context(series, static)
+    features, anchors, fill_values = context["features"], context["anchors"], context["fill_values"]
+    last_dates, history_lengths = context["last_dates"], context["history_lengths"]
+    print(f"--- Running Model A (Recursive Sprinter) for {len(last_dates)} series ---")
+    column = {name: j for j, name in enumerate(features)}
+
+    history = SalesHistory(
+        context["tails"], capacity=HISTORY_CAPACITY,
+        ewm=context["ewm"], ewm_weight=context["ewm_weight"]
+    )
+    rows = np.arange(len(last_dates))
+    X = np.empty((len(last_dates), len(features)))
+    if static is not None:
+        for name in static.columns:
+            X[:, column[name]] = static[name]
+    predicted = np.empty((len(last_dates), days_to_forecast))
 
     for i in range(1, days_to_forecast + 1):
-        next_date = last_date + timedelta(days=i)
-        temp_df = pd.DataFrame({"date": [next_date]})
-        next_day_of_week = next_date.dayofweek
-        
-        # Create features for the next day
-        temp_df["month"] = next_date.month
-        temp_df["day_of_week"] = next_day_of_week
-        temp_df["day_of_year"] = next_date.timetuple().tm_yday
-        temp_df["is_weekend"] = int(next_day_of_week >= 5)
-        temp_df["sin_dayofyear"] = np.sin(2 * np.pi * temp_df["day_of_year"] / 365)
-        temp_df["cos_dayofyear"] = np.cos(2 * np.pi * temp_df["day_of_year"] / 365)
-        temp_df["time_index"] = len(forecast_df) + i
-        for lag in [1, 3, 7, 14]:
-            temp_df[f"lag_{lag}"] = forecast_df["quantity_sold"].iloc[-lag]
-        for window in [3, 7, 14, 30]:
-            temp_df[f"rolling_mean_{window}"] = forecast_df["quantity_sold"].iloc[-window:].mean()
-            temp_df[f"rolling_std_{window}"] = forecast_df["quantity_sold"].iloc[-window:].std()
-        temp_df["ewm_mean_7"] = forecast_df["quantity_sold"].ewm(span=7).mean().iloc[-1]
-        temp_df = temp_df.fillna(temp_df_mean) 
-
-        # Predict the deviation
-        ml_pred_deviation = model.predict(temp_df[features])[0]
+        next_dates = last_dates + timedelta(days=i)
+        next_day_of_week = next_dates.dayofweek.to_numpy()
+        day_of_year = next_dates.dayofyear.to_numpy()
+
+        # Create features for the next day, one row per product
+        X[:, column["month"]] = next_dates.month
+        X[:, column["day_of_week"]] = next_day_of_week
+        X[:, column["day_of_year"]] = day_of_year
+        X[:, column["is_weekend"]] = next_day_of_week >= 5
+        X[:, column["sin_dayofyear"]] = np.sin(2 * np.pi * day_of_year / 365)
+        X[:, column["cos_dayofyear"]] = np.cos(2 * np.pi * day_of_year / 365)
+        # The history has grown by i - 1 predictions at this point
+        X[:, column["time_index"]] = history_lengths + (i - 1) + i
+        for lag in LAGS:
+            X[:, column[f"lag_{lag}"]] = history.lag(lag)
+        for window in ROLLING_WINDOWS:
+            mean, std = _window_mean_std(history.tail(window))
+            X[:, column[f"rolling_mean_{window}"]] = mean
+            X[:, column[f"rolling_std_{window}"]] = std
+        X[:, column[f"ewm_mean_{EWM_SPAN}"]] = history.ewm
+        missing = np.isnan(X)
+        if missing.any():
+            X[missing] = fill_values[missing]
+
+        # Predict the deviation for every product in one call
+        with metrics.stage("forecast.recursive_xgb_predict"):
+            ml_pred_deviation = model.predict(X)
 
         # Re-compose the prediction
-        seasonal_anchor_value = seasonal_anchors.get(next_day_of_week, global_mean_anchor)
-        final_pred = max(0, seasonal_anchor_value + ml_pred_deviation) 
+        final_pred = np.maximum(0, anchors[rows, next_day_of_week] + ml_pred_deviation)
+        predicted[:, i - 1] = final_pred
+
+        # Append the new predictions for the *next* loop
+        history.append(final_pred)
 
-        predictions.append({
-            "date": next_date.strftime("%Y-%m-%d"),
-            "predicted_quantity": round(float(final_pred), 2)
-        })
-        
-        # Append the new prediction for the *next* loop
-        new_row = {"date": next_date, "quantity_sold": final_pred}
-        forecast_df = pd.concat([forecast_df, pd.DataFrame([new_row])], ignore_index=True)
+    if scales is not None:
+        predicted *= scales[:, None]
+    return _forecast_frame(context, predicted)
 
-    return predictions
+
+def forecast_recursive(df, model, days_to_forecast):
+    """
+    (v4 Logic) Predicts 30 days ahead using a recursive loop.
+
+    Lags, rolling windows and the EWM are updated incrementally from a ring
+    buffer, and one feature row is reused for every step. Returns a
+    (days,) array for the days after the last history date.
+    """
+    return forecast_recursive_batch({0: df}, model, days_to_forecast)["predicted"][0]
 
 
 # ---------- 3. MODEL B: DIRECT "MARATHONER" (v5) ----------
-def train_direct_model(df, forecast_horizon):
+def train_direct_model(df, forecast_horizon, engine="multioutput"):
     """
     (v5 Logic) Trains a MultiOutput model to predict all 30 days at once.
+
+    engine="native" trains one XGBoost booster with multi_strategy="multi_output_tree"
+    instead of 30 independent models; both predict a (n, horizon) array.
     """
-    print(f"--- Training Model B (Direct Marathoner) for {forecast_horizon} days ---")
-    features = [
-        col for col in df.columns if col not in [
-            "date", "quantity_sold", "seasonal_avg", "quantity_sold_deviation"
-        ]
-    ]
+    print(f"--- Training Model B (Direct Marathoner, {engine}) for {forecast_horizon} days ---")
+    features = _feature_columns(df)
     target = "quantity_sold_deviation"
     
-    X_list, y_list = [], []
-    
-    # Sliding window to create 30-day targets
-    for i in range(len(df) - forecast_horizon):
-        X_list.append(df[features].iloc[i])
-        y_list.append(df[target].iloc[i+1 : i+1+forecast_horizon].values)
-    
-    X = pd.DataFrame(X_list)
-    y = np.array(y_list)
+    # Sliding window to create 30-day targets: row i is paired with
+    # target[i+1 : i+1+horizon], taken as a strided view (no per-row copies)
+    n_windows = len(df) - forecast_horizon
+    X = df[features].iloc[:n_windows].astype(np.float64)
+    target_windows = sliding_window_view(df[target].to_numpy(dtype=np.float64), forecast_horizon)
+    y = target_windows[1 : n_windows + 1]
+    if "product_id" in df:
+        # Stacked series: only keep windows whose targets are the same product
+        product_ids = df["product_id"].to_numpy()
+        same_product = product_ids[:n_windows] == product_ids[forecast_horizon:]
+        X, y = X[same_product], y[same_product]
     
     print(f"Direct training data shape: X={X.shape}, y={y.shape}")
 
+    if engine == "native":
+        # One booster for all horizon days
+        model = XGBRegressor(
+            objective="reg:squarederror", tree_method="hist",
+            multi_strategy="multi_output_tree",
+            random_state=42, n_estimators=500, learning_rate=0.05,
+            max_depth=6, subsample=0.8, colsample_bytree=0.8, n_jobs=-1
+        )
+        print("Fitting native multi-output booster...")
+        model.fit(X, y)
+        return model
+
     # A strong base model
     base_model = XGBRegressor(
         objective="reg:squarederror", 
@@ -175,113 +723,342 @@ def train_direct_model(df, forecast_horizon):
     wrapper.fit(X, y) 
     return wrapper
 
-def forecast_direct(df_raw, model, days_to_forecast):
+def forecast_direct_batch(series, model, days_to_forecast, static=None, scales=None, context=None):
     """
-    (v5 Logic) Predicts all 30 days in a single shot. No loop.
+    (v5 Logic) Direct forecasts for many series with one model.predict call.
+
+    series maps product id -> raw DataFrame (date, quantity_sold); static,
+    scales and context are as in forecast_recursive_batch.
+    Returns a forecast frame (see _forecast_frame).
     """
-    print("--- Running Model B (Direct Marathoner) ---")
-    historical_df_processed = create_features(df_raw.copy())
-    
-    seasonal_anchors = historical_df_processed.groupby("day_of_week")["seasonal_avg"].first().to_dict()
-    global_mean_anchor = historical_df_processed["seasonal_avg"].mean() 
-    
-    features = [
-        col for col in historical_df_processed.columns if col not in [
-            "date", "quantity_sold", "seasonal_avg", "quantity_sold_deviation"
-        ]
-    ]
-    # Get features from the *last* day of history
-    X_last = historical_df_processed[features].iloc[[-1]] 
-    
-    # Predict all 30 deviations at once
-    predicted_deviations = model.predict(X_last)[0]
+    if context is None:
+        with metrics.stage("forecast.features"):
+            context = _series_context(series, static)
+    anchors, last_dates = context["anchors"], context["last_dates"]
+    print(f"--- Running Model B (Direct Marathoner) for {len(last_dates)} series ---")
 
-    predictions = []
-    last_date = df_raw["date"].max()
-    
-    for i in range(days_to_forecast):
-        next_date = last_date + timedelta(days=i+1)
-        next_day_of_week = next_date.dayofweek
-        
-        seasonal_anchor_value = seasonal_anchors.get(next_day_of_week, global_mean_anchor)
-        deviation = predicted_deviations[i]
-        
-        final_pred = max(0, seasonal_anchor_value + deviation) 
+    # Features from the *last* day of each product's history; predict all
+    # 30 deviations of every product at once
+    with metrics.stage("forecast.direct_xgb_predict"):
+        predicted_deviations = model.predict(context["X_last"])[:, :days_to_forecast]
 
-        predictions.append({
-            "date": next_date.strftime("%Y-%m-%d"),
-            "predicted_quantity": round(float(final_pred), 2)
-        })
+    day_of_week = np.add.outer(last_dates.dayofweek.to_numpy(), np.arange(1, days_to_forecast + 1)) % 7
+    seasonal_anchor_values = np.take_along_axis(anchors, day_of_week, axis=1)
+    predicted = np.maximum(0, seasonal_anchor_values + predicted_deviations)
+    if scales is not None:
+        predicted *= scales[:, None]
 
-    return predictions
+    return _forecast_frame(context, predicted)
+
+
+def forecast_direct(df_raw, model, days_to_forecast):
+    """
+    (v5 Logic) Predicts all 30 days in a single shot. No loop.
+
+    Returns a (days,) array for the days after the last history date.
+    """
+    return forecast_direct_batch({0: df_raw}, model, days_to_forecast)["predicted"][0]
 
 
 # ---------- 4. MODEL C: THE "ENSEMBLE-X" BLENDER (v6) ----------
 def ensemble_forecasts(forecast_A, forecast_B):
     """
     (v6 Logic) Blends the two forecasts with a time-based fade.
+
+    forecast_A and forecast_B are (days,) or (P, days) prediction arrays;
+    every row is blended at once.
     """
     print("--- Blending forecasts into Ensemble-X ---")
-    final_ensembled_forecast = []
-    days_to_forecast = len(forecast_A)
-
-    for i in range(days_to_forecast):
-        
-        # Calculate the "fade"
-        # At day 0 (i=0), trust_A = 1.0 (100%)
-        # At day 29 (i=29), trust_A = ~0.0 (0%)
-        trust_A = 1.0 - (i / (days_to_forecast - 1)) # Trust Sprinter less over time
-        trust_B = 1.0 - trust_A # Trust Marathoner more over time
-
-        pred_A = forecast_A[i]["predicted_quantity"]
-        pred_B = forecast_B[i]["predicted_quantity"]
-
-        # The final blended prediction
-        final_pred = (pred_A * trust_A) + (pred_B * trust_B)
-
-        final_ensembled_forecast.append({
-            "date": forecast_A[i]["date"], # Dates are the same
-            "predicted_quantity": round(float(final_pred), 2)
-        })
+    days_to_forecast = np.shape(forecast_A)[-1]
+
+    # Calculate the "fade"
+    # At day 0 (i=0), trust_A = 1.0 (100%)
+    # At day 29 (i=29), trust_A = ~0.0 (0%)
+    trust_A = 1.0 - np.arange(days_to_forecast) / max(days_to_forecast - 1, 1) # Trust Sprinter less over time
+    trust_B = 1.0 - trust_A # Trust Marathoner more over time
+
+    # The final blended prediction
+    return (forecast_A * trust_A) + (forecast_B * trust_B)
+
+
+def forecast_ensemble_batch(snapshot, series, days_to_forecast, categories=None, use_feature_store=False):
+    """
+    Both models of a snapshot over {product_id: raw DataFrame}, blended per product.
+    Returns a forecast frame; _forecast_records turns it into the response.
+
+    A global snapshot (it carries "encoders") sees each series scaled to a
+    common level and tagged with its product/category codes. With
+    use_feature_store, only the days added since the last request are
+    processed and the features come from the stored window state.
+    """
+    models = snapshot["models"]
+    states = None
+    if use_feature_store:
+        with metrics.stage("forecast.feature_store_sync"):
+            states = feature_store.sync(series)
+    static, scales = None, None
+    if "encoders" in models:
+        if states is not None:
+            scales = np.array([state["total"] / state["count"] for state in states.values()])
+            scales = np.where(scales > 0, scales, 1.0)
+        else:
+            series, scales = scale_series(series)
+        static = series_features(series, categories or {}, models["encoders"], scales)
+
+    # --- Features once, shared by both models ---
+    with metrics.stage("forecast.features"):
+        if states is not None:
+            context = _store_context(states, static, scales)
+        else:
+            context = _series_context(series, static)
+
+    # --- Generate BOTH forecasts for the whole batch ---
+    with metrics.stage("forecast.recursive"):
+        forecasts_A = forecast_recursive_batch(None, models["recursive"], days_to_forecast, scales=scales, context=context)
+    with metrics.stage("forecast.direct"):
+        forecasts_B = forecast_direct_batch(None, models["direct"], days_to_forecast, scales=scales, context=context)
+
+    # --- Blend every product with the v6 logic in one array op ---
+    with metrics.stage("forecast.blend"):
+        return _forecast_frame(context, ensemble_forecasts(forecasts_A["predicted"], forecasts_B["predicted"]))
+
+
+def forecast_ensemble_cached(snapshot, series, days_to_forecast, categories=None, use_feature_store=False):
+    """
+    forecast_ensemble_batch through forecast_cache.
+
+    Only products whose history, category or horizon changed since their
+    last forecast with this snapshot are run through the models; the rest
+    come from the cache. Returns a forecast frame in the order of series.
+    """
+    categories = categories or {}
+    model_name = "global" if "encoders" in snapshot["models"] else "series"
+    with metrics.stage("forecast.cache_lookup"):
+        keys = {
+            product_id: ForecastCache.key(
+                model_name, snapshot["version"], days_to_forecast, product_id, df, categories.get(product_id)
+            )
+            for product_id, df in series.items()
+        }
+        forecasts = {product_id: forecast_cache.get(key) for product_id, key in keys.items()}
+
+    missing = {product_id: df for product_id, df in series.items() if forecasts[product_id] is None}
+    if missing:
+        frame = forecast_ensemble_batch(snapshot, missing, days_to_forecast, categories, use_feature_store)
+        for p, product_id in enumerate(frame["product_ids"]):
+            forecasts[product_id] = (frame["last_dates"][p], frame["predicted"][p])
+            forecast_cache.put(keys[product_id], *forecasts[product_id])
+
+    product_ids = list(series)
+    return {
+        "product_ids": product_ids,
+        "last_dates": pd.DatetimeIndex([forecasts[product_id][0] for product_id in product_ids]),
+        "predicted": np.vstack([forecasts[product_id][1] for product_id in product_ids])
+    }
+
+
+# ---------- 5. TRAINING JOBS ----------
+def run_series_training(job_id, historical_data, direct_engine, search):
+    """
+    The /train job (runs in a training worker process).
+
+    Returns {"models": ..., "result": ...}; the models are published by the
+    web process when the job finishes.
+    """
+    report_progress(job_id, "features")
+    df = pd.DataFrame(historical_data)
+    df["date"] = pd.to_datetime(df["date"])
+    df = df.sort_values("date")
+    
+    df_processed = create_features(df)
     
-    return final_ensembled_forecast
+    if len(df_processed) < (FORECAST_HORIZON * 2):
+        raise ValueError(f"Not enough data. Need ~{FORECAST_HORIZON * 2} days, found {len(df_processed)}.")
+
+    # --- Train Model A (Recursive) ---
+    report_progress(job_id, "recursive_model")
+    start = time.perf_counter()
+    model_recursive = train_recursive_model(df_processed, search=search)
+    recursive_seconds = time.perf_counter() - start
+
+    # --- Train Model B (Direct) ---
+    report_progress(job_id, "direct_model")
+    start = time.perf_counter()
+    model_direct = train_direct_model(df_processed, forecast_horizon=FORECAST_HORIZON, engine=direct_engine)
+    direct_seconds = time.perf_counter() - start
+
+    return {
+        "models": {"recursive": model_recursive, "direct": model_direct},
+        "result": {
+            "message": "Ensemble-X (v6) models (Recursive + Direct) trained successfully.",
+            "direct_engine": direct_engine,
+            "search": search,
+            "fit_seconds": {"recursive": round(recursive_seconds, 2), "direct": round(direct_seconds, 2)}
+        }
+    }
+
+
+def run_global_training(job_id, products, categories, direct_engine, search):
+    """The /train/global job (runs in a training worker process), see run_series_training"""
+    report_progress(job_id, "features")
+
+    # Series too short to give one full direct-model window are skipped
+    min_days = MIN_HISTORY + FORECAST_HORIZON
+    series, skipped = {}, {}
+    for product_id, historical_data in products.items():
+        if not historical_data or len(historical_data) < min_days:
+            skipped[product_id] = f"Not enough history. Need at least {min_days} days, found {len(historical_data or [])}."
+            continue
+        df = pd.DataFrame(historical_data)[["date", "quantity_sold"]]
+        df["date"] = pd.to_datetime(df["date"])
+        series[product_id] = df.sort_values("date").reset_index(drop=True)
+
+    if not series:
+        raise ValueError(f"No product has enough history to train on. Skipped: {skipped}")
+
+    scaled, scales = scale_series(series)
+    encoders = fit_series_encoders(series, categories)
+    static = series_features(series, categories, encoders, scales)
+    df_processed = stacked_features(scaled, static)
+
+    # --- Train Model A (Recursive) ---
+    report_progress(job_id, "recursive_model")
+    start = time.perf_counter()
+    model_recursive = train_recursive_model(
+        df_processed.drop(columns="product_id"), search=search, params_path=GLOBAL_RECURSIVE_PARAMS_PATH
+    )
+    recursive_seconds = time.perf_counter() - start
+
+    # --- Train Model B (Direct) on per-product windows ---
+    report_progress(job_id, "direct_model")
+    start = time.perf_counter()
+    model_direct = train_direct_model(df_processed, forecast_horizon=FORECAST_HORIZON, engine=direct_engine)
+    direct_seconds = time.perf_counter() - start
+
+    return {
+        "models": {"recursive": model_recursive, "direct": model_direct, "encoders": encoders},
+        "result": {
+            "message": f"Global Ensemble-X models trained on {len(series)} products ({len(df_processed)} rows).",
+            "products_trained": len(series),
+            "skipped": skipped,
+            "direct_engine": direct_engine,
+            "search": search,
+            "fit_seconds": {"recursive": round(recursive_seconds, 2), "direct": round(direct_seconds, 2)}
+        }
+    }
+
+
+def _publisher(registry):
+    """Job callback: swap the trained models in, return the job result"""
+    def publish(payload):
+        version = registry.publish(payload["models"])
+        # Forecasts of the old models must not be served again
+        forecast_cache.invalidate()
+        print(f"Models saved as version {version} ({registry.manifest_path})")
+        return payload["result"]
+    return publish
+
+
+# ---------- 6. API ROUTES (MODIFIED) ----------
+def _submit_training(model, fn, args, publish):
+    job, created = training_jobs.submit(model, fn, args, publish)
+    if not created:
+        return jsonify({
+            "success": False,
+            "message": f"A training job for the {model} models is already {job['status']}.",
+            "job_id": job["id"]
+        }), 409
+    return jsonify({
+        "success": True,
+        "message": "Training job queued.",
+        "job_id": job["id"],
+        "status_url": f"/train/{job['id']}"
+    }), 202
 
 
-# ---------- 5. API ROUTES (MODIFIED) ----------
 @app.route("/train", methods=["POST"])
 def train():
+    """
+    Queue a training job for the per-series models; poll /train/<job_id>.
+    """
     try:
         data = request.get_json()
         historical_data = data.get("historical_data", [])
+        direct_engine = data.get("direct_engine", "multioutput")
+        search = data.get("search", "randomized")
         if not historical_data:
             return jsonify({"success": False, "message": "No historical data provided."}), 400
+        if direct_engine not in DIRECT_ENGINES:
+            return jsonify({"success": False, "message": f"Unknown direct_engine '{direct_engine}'. Use one of {list(DIRECT_ENGINES)}."}), 400
+        if search not in RECURSIVE_SEARCHES:
+            return jsonify({"success": False, "message": f"Unknown search '{search}'. Use one of {list(RECURSIVE_SEARCHES)}."}), 400
 
-        df = pd.DataFrame(historical_data)
-        df["date"] = pd.to_datetime(df["date"])
-        df = df.sort_values("date")
-        
-        df_processed = create_features(df)
-        
-        if len(df_processed) < (FORECAST_HORIZON * 2):
-             return jsonify({"success": False, "message": f"Not enough data. Need ~{FORECAST_HORIZON * 2} days, found {len(df_processed)}."}), 400
-
-        # --- Train and save Model A (Recursive) ---
-        model_recursive = train_recursive_model(df_processed)
-        joblib.dump(model_recursive, MODEL_PATH_RECURSIVE)
-        print(f"Model A saved to {MODEL_PATH_RECURSIVE}")
-
-        # --- Train and save Model B (Direct) ---
-        model_direct = train_direct_model(df_processed, forecast_horizon=FORECAST_HORIZON)
-        joblib.dump(model_direct, MODEL_PATH_DIRECT)
-        print(f"Model B saved to {MODEL_PATH_DIRECT}")
-        
-        return jsonify({"success": True, "message": "Ensemble-X (v6) models (Recursive + Direct) trained successfully."})
+        return _submit_training(
+            "series", run_series_training, (historical_data, direct_engine, search),
+            _publisher(demand_models)
+        )
     
     except Exception as e:
         print("Error in training:", e)
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route("/train/global", methods=["POST"])
+def train_global():
+    """
+    Queue a job fitting one recursive and one direct model across many SKUs (e.g. nightly).
+
+    Body: {"products": {product_id: historical_data}, "categories": {product_id: category},
+           "direct_engine": "multioutput" | "native"}
+    Each series is scaled by its mean and tagged with product/category codes
+    (SERIES_FEATURES), so one pair of models serves the whole catalogue.
+    """
+    try:
+        data = request.get_json()
+        products = data.get("products", {})
+        categories = data.get("categories", {})
+        direct_engine = data.get("direct_engine", "multioutput")
+        search = data.get("search", "randomized")
+        if not products or not isinstance(products, dict):
+            return jsonify({"success": False, "message": "No products provided. Send {product_id: historical_data}."}), 400
+        if direct_engine not in DIRECT_ENGINES:
+            return jsonify({"success": False, "message": f"Unknown direct_engine '{direct_engine}'. Use one of {list(DIRECT_ENGINES)}."}), 400
+        if search not in RECURSIVE_SEARCHES:
+            return jsonify({"success": False, "message": f"Unknown search '{search}'. Use one of {list(RECURSIVE_SEARCHES)}."}), 400
+
+        return _submit_training(
+            "global", run_global_training, (products, categories, direct_engine, search),
+            _publisher(global_demand_models)
+        )
+
+    except Exception as e:
+        print("Error in global training:", e)
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@app.route("/train/<job_id>", methods=["GET"])
+def train_status(job_id):
+    """Status, stage, elapsed time and (when done) result or error of a training job"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Unknown training job '{job_id}'."}), 404
+    return jsonify({"success": True, "job": job})
+
+
+def _model_snapshot(data):
+    """The requested model set ("series" or "global") as (snapshot, error response)"""
+    model_name = data.get("model", "series")
+    if model_name not in DEMAND_MODELS:
+        return None, (jsonify({"success": False, "message": f"Unknown model '{model_name}'. Use one of {list(DEMAND_MODELS)}."}), 400)
+
+    registry = global_demand_models if model_name == "global" else demand_models
+    snapshot = registry.snapshot()
+    if snapshot is None:
+        route = "/train/global" if model_name == "global" else "/train"
+        return None, (jsonify({"success": False, "message": f"Models not trained. Please call {route} first."}), 400)
+    return snapshot, None
+
+
 @app.route("/predict/demand", methods=["POST"])
 def predict():
     try:
@@ -292,33 +1069,154 @@ def predict():
         if not historical_data:
             return jsonify({"success": False, "message": "No historical data provided."}), 400
 
-        # --- Check if BOTH models are trained ---
-        if not os.path.exists(MODEL_PATH_RECURSIVE) or not os.path.exists(MODEL_PATH_DIRECT):
-             return jsonify({"success": False, "message": "Models not trained. Please call /train first."}), 400
-        
-        # --- Load both models ---
-        model_A = joblib.load(MODEL_PATH_RECURSIVE)
-        model_B = joblib.load(MODEL_PATH_DIRECT)
-            
-        df_raw = pd.DataFrame(historical_data)
-        df_raw["date"] = pd.to_datetime(df_raw["date"])
-        
-        # --- Generate BOTH forecasts ---
-        forecast_A = forecast_recursive(df_raw, model_A, days_to_forecast)
-        forecast_B = forecast_direct(df_raw, model_B, days_to_forecast)
-        
-        # --- Blend them with the v6 logic ---
-        final_forecast = ensemble_forecasts(forecast_A, forecast_B)
+        product_id = data.get("product_id")
+        use_feature_store = bool(data.get("feature_store", False))
+        if use_feature_store and product_id is None:
+            return jsonify({"success": False, "message": "feature_store needs a product_id."}), 400
 
-        return jsonify({
+        # "timings": true returns the seconds spent per stage
+        with metrics.collect(bool(data.get("timings", False))) as timings, metrics.stage("forecast.total"):
+            # --- Check if BOTH models are trained ---
+            snapshot, error = _model_snapshot(data)
+            if error:
+                return error
+
+            with metrics.stage("forecast.parse"):
+                df_raw = pd.DataFrame(historical_data)
+                df_raw["date"] = pd.to_datetime(df_raw["date"])
+
+            # --- Generate BOTH forecasts and blend them with the v6 logic ---
+            frame = forecast_ensemble_cached(
+                snapshot, {product_id: df_raw}, days_to_forecast, {product_id: data.get("category")},
+                use_feature_store=use_feature_store
+            )
+            final_forecast = _forecast_records(frame)[product_id]
+
+        response = {
             "success": True,
             "algorithm": "Ensemble-X (v6: Recursive + Direct Blend)",
             "forecast": final_forecast
-        })
+        }
+        if timings is not None:
+            response["timings"] = timings
+        return jsonify(response)
     except Exception as e:
         print("Error during prediction:", e)
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route("/predict/demand/batch", methods=["POST"])
+def predict_batch():
+    """
+    Forecasts for many products in one request.
+
+    Body: {"products": {product_id: [{"date", "quantity_sold"}, ...]}, "days_to_forecast": 30,
+           "model": "series" | "global", "categories": {product_id: category},
+           "feature_store": false, "timings": false}
+    All series share one feature frame, one predict call per recursive step
+    and one direct predict call. With "feature_store": true the histories
+    are only used to append new days to the stored per-product state.
+    Products whose history is too short are reported under "errors"
+    instead of failing the batch.
+    """
+    try:
+        data = request.get_json()
+        products = data.get("products", {})
+        days_to_forecast = data.get("days_to_forecast", FORECAST_HORIZON)
+
+        if not products or not isinstance(products, dict):
+            return jsonify({"success": False, "message": "No products provided. Send {product_id: historical_data}."}), 400
+
+        with metrics.collect(bool(data.get("timings", False))) as timings, metrics.stage("forecast.total"):
+            snapshot, error = _model_snapshot(data)
+            if error:
+                return error
+
+            series, errors = {}, {}
+            with metrics.stage("forecast.parse"):
+                for product_id, historical_data in products.items():
+                    if not historical_data or len(historical_data) < MIN_HISTORY:
+                        errors[product_id] = f"Not enough history. Need at least {MIN_HISTORY} days, found {len(historical_data or [])}."
+                        continue
+                    df_raw = pd.DataFrame(historical_data)
+                    df_raw["date"] = pd.to_datetime(df_raw["date"])
+                    series[product_id] = df_raw
+
+            forecasts = {}
+            if series:
+                forecasts = _forecast_records(forecast_ensemble_cached(
+                    snapshot, series, days_to_forecast, data.get("categories", {}),
+                    use_feature_store=bool(data.get("feature_store", False))
+                ))
+
+        response = {
+            "success": True,
+            "algorithm": "Ensemble-X (v6: Recursive + Direct Blend)",
+            "forecasts": forecasts,
+            "errors": errors
+        }
+        if timings is not None:
+            response["timings"] = timings
+        return jsonify(response)
+    except Exception as e:
+        print("Error during batch prediction:", e)
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@app.route("/features/invalidate", methods=["POST"])
+def invalidate_features():
+    """
+    Drop the stored feature state of products whose past sales were corrected.
+
+    Body: {"product_ids": [...]}. Their next forecast rebuilds the state from
+    the full history. New days and edits within the feature windows are
+    picked up without this (FeatureStore.sync).
+    """
+    try:
+        data = request.get_json()
+        product_ids = data.get("product_ids", [])
+        if not isinstance(product_ids, list) or not product_ids:
+            return jsonify({"success": False, "message": "No product_ids provided."}), 400
+        return jsonify({"success": True, "invalidated": feature_store.invalidate(product_ids)})
+    except Exception as e:
+        print("Error invalidating features:", e)
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@app.route("/models", methods=["GET"])
+def models_status():
+    return jsonify({
+        "success": True,
+        **demand_models.status(),
+        "global": global_demand_models.status(),
+        "forecast_cache": forecast_cache.stats()
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Stage latency histograms, counters and gauges (e.g. the forecast cache), Prometheus text format.
+
+    Under serve.py these add up every worker's metrics (see
+    StageMetrics.share), whichever worker answers the scrape.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """Liveness of this server process and whether its models are loaded"""
+    return jsonify({
+        "success": True,
+        "status": "ok",
+        "pid": os.getpid(),
+        "models_loaded": {
+            "series": demand_models.snapshot() is not None,
+            "global": global_demand_models.snapshot() is not None
+        }
+    })
+
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    app.run(debug=True, port=5001)
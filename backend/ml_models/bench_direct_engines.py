@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# backend/ml_models/bench_direct_engines.py
+#
+# Compare the direct-model engines (MultiOutputRegressor wrapper vs native
+# multi-output booster) on fit time, artifact size and predict latency.
+#
+# Usage:
+#   python bench_direct_engines.py                  # synthetic 2-year daily series
+#   python bench_direct_engines.py history.json     # [{"date": ..., "quantity_sold": ...}, ...]
+
+import sys
+import json
+import os
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+from api import create_features, train_direct_model, forecast_direct, DIRECT_ENGINES, FORECAST_HORIZON
+from model_store import save_artifact
+
+
+def synthetic_daily_sales(n_days=730, seed=42, start="2023-01-01"):
+    """Daily sales with weekly and yearly seasonality, trend and noise"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n_days, freq="D")
+    t = np.arange(n_days)
+    quantity = (
+        50
+        + 0.02 * t
+        + 8 * np.sin(2 * np.pi * t / 365)
+        + 12 * (dates.dayofweek >= 5)
+        + rng.normal(0, 4, n_days)
+    )
+    return pd.DataFrame({"date": dates, "quantity_sold": np.maximum(quantity, 0)})
+
+
+def benchmark_engine(df_raw, df_processed, engine, predict_runs=20):
+    start = time.perf_counter()
+    model = train_direct_model(df_processed, forecast_horizon=FORECAST_HORIZON, engine=engine)
+    fit_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = save_artifact(model, os.path.join(tmp_dir, f"direct_{engine}.pkl"))
+        artifact_bytes = os.path.getsize(path)
+
+    forecast_direct(df_raw, model, FORECAST_HORIZON)  # warm up
+    latencies = []
+    for _ in range(predict_runs):
+        start = time.perf_counter()
+        forecast_direct(df_raw, model, FORECAST_HORIZON)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "fit_seconds": round(fit_seconds, 3),
+        "artifact_bytes": artifact_bytes,
+        "predict_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "predict_ms_p99": round(float(np.percentile(latencies, 99)) * 1000, 3)
+    }
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            df_raw = pd.DataFrame(json.load(f))
+        df_raw["date"] = pd.to_datetime(df_raw["date"])
+        df_raw = df_raw.sort_values("date").reset_index(drop=True)
+    else:
+        df_raw = synthetic_daily_sales()
+
+    df_processed = create_features(df_raw)
+    results = {engine: benchmark_engine(df_raw, df_processed, engine) for engine in DIRECT_ENGINES}
+    print(json.dumps({"n_days": len(df_raw), "horizon": FORECAST_HORIZON, "engines": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# backend/ml_models/bench_suite.py
+#
+# Benchmarks for the pricing and demand-forecast hot paths: train time,
+# single and batch predict latency (p50/p99) with and without the price
+# optimizer, and /predict/demand end-to-end latency through the Flask test
+# client for catalogues of 100 to 100k products. Results are written as JSON
+# so runs on two commits can be compared.
+#
+# Usage:
+#   python bench_suite.py                                  # full run -> bench_results.json
+#   python bench_suite.py --sizes 100,1000 --output quick.json
+#   python bench_suite.py --compare before.json after.json # ratios after / before
+#
+# Everything runs in a temporary directory: the demand models are trained
+# there and nothing next to this file (models, caches, stores) is touched.
+
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import numpy as np
+import pandas as pd
+import sklearn
+import xgboost
+from pricing_model import SmartPricingModel, generate_synthetic_training_data
+from bench_direct_engines import synthetic_daily_sales
+import api
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def latency(fn, runs, warmup=1):
+    """p50/p99/mean wall time of fn() in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return {
+        "runs": runs,
+        "p50_ms": round(float(np.percentile(times, 50)), 3),
+        "p99_ms": round(float(np.percentile(times, 99)), 3),
+        "mean_ms": round(float(times.mean()), 3)
+    }
+
+
+def timed(fn):
+    """(result, seconds) of one call"""
+    start = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - start, 3)
+
+
+def runs_for(size, runs):
+    """Fewer repetitions for the big catalogues"""
+    return runs if size <= 1000 else max(1, runs // 5) if size <= 10000 else 1
+
+
+def bench_pricing(sizes, train_samples, runs, gp_runs, gp_max_products):
+    catalogue, generate_seconds = timed(lambda: generate_synthetic_training_data(max(sizes)))
+    model = SmartPricingModel()
+    _, train_seconds = timed(lambda: model.train(catalogue[:train_samples]))
+    _, distill_seconds = timed(model.fit_surrogate)
+    product = catalogue[0]
+
+    single = {
+        "no_optimizer": latency(lambda: model.predict_price(product, use_bayesian=False), runs),
+        "grid": latency(lambda: model.predict_price(product, optimizer="grid"), runs),
+        "analytic": latency(lambda: model.predict_price(product, optimizer="analytic"), runs),
+        # Distilled surrogate + analytic optimizer, the interactive path
+        "fast": latency(lambda: model.predict_price(product, mode="fast"), runs),
+        # One gp_minimize run per product
+        "gp": latency(lambda: model.predict_price(product, optimizer="gp"), gp_runs, warmup=0)
+    }
+    base_price = float(model.predict_prices([product], use_bayesian=False)[0]["suggested_price"])
+    optimize_args = (product, base_price, product["cost_price"] * 1.15, product["current_price"] * 1.5)
+    bayesian_optimize = latency(lambda: model._bayesian_optimize(*optimize_args), gp_runs, warmup=0)
+
+    batch = {}
+    for size in sizes:
+        products = catalogue[:size]
+        size_runs = runs_for(size, runs)
+        batch[str(size)] = {
+            "no_optimizer": latency(lambda: model.predict_prices(products, use_bayesian=False), size_runs),
+            "grid": latency(lambda: model.predict_prices(products, optimizer="grid"), size_runs),
+            "analytic": latency(lambda: model.predict_prices(products, optimizer="analytic"), size_runs)
+        }
+    gp_products = catalogue[:gp_max_products]
+    batch["gp"] = {
+        "products": len(gp_products),
+        **latency(lambda: model.predict_prices(gp_products, optimizer="gp"), 1, warmup=0)
+    }
+
+    return {
+        "generate_seconds": {"products": max(sizes), "seconds": generate_seconds},
+        "train_seconds": {"samples": train_samples, "seconds": train_seconds},
+        "distill_seconds": distill_seconds,
+        "predict_single": single,
+        "bayesian_optimize": bayesian_optimize,
+        "predict_batch": batch
+    }
+
+
+def history_records(df):
+    return [{"date": date.strftime("%Y-%m-%d"), "quantity_sold": float(q)} for date, q in zip(df["date"], df["quantity_sold"])]
+
+
+def bench_demand(sizes, runs, history_days, catalogue_days, batch_size, search, direct_engine):
+    df_raw = synthetic_daily_sales(history_days)
+    _, features_seconds = timed(lambda: api.create_features(df_raw))
+    features = latency(lambda: api.create_features(df_raw), runs)
+
+    # Train into the working directory and serve the result from the registry
+    payload, train_seconds = timed(lambda: api.run_series_training(None, history_records(df_raw), direct_engine, search))
+    api.demand_models.publish(payload["models"])
+    models = payload["models"]
+
+    forecasters = {
+        "forecast_recursive": latency(lambda: api.forecast_recursive(df_raw, models["recursive"], api.FORECAST_HORIZON), runs),
+        "forecast_direct": latency(lambda: api.forecast_direct(df_raw, models["direct"], api.FORECAST_HORIZON), runs)
+    }
+
+    client = api.app.test_client()
+
+    def post(url, body):
+        response = client.post(url, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {response.get_json()}")
+
+    def cold(url, body):
+        # Every request misses the forecast cache
+        def call():
+            api.forecast_cache.invalidate()
+            post(url, body)
+        return call
+
+    single_body = {"historical_data": history_records(df_raw), "days_to_forecast": api.FORECAST_HORIZON}
+    endpoint = {
+        "cold": latency(cold("/predict/demand", single_body), runs),
+        "cached": latency(lambda: post("/predict/demand", single_body), runs)
+    }
+
+    # Catalogue sweep: /predict/demand/batch in chunks of batch_size products.
+    # One chunk of distinct histories is built once and posted for every chunk
+    # of the catalogue, with the forecast cache cleared before each request
+    chunk = {
+        f"p{i}": history_records(synthetic_daily_sales(catalogue_days, seed=i))
+        for i in range(min(batch_size, max(sizes)))
+    }
+    catalogue = {}
+    for size in sizes:
+        chunks = [min(batch_size, size - start) for start in range(0, size, batch_size)]
+        bodies = {
+            n: {"products": dict(list(chunk.items())[:n]), "days_to_forecast": api.FORECAST_HORIZON}
+            for n in set(chunks)
+        }
+        size_runs = runs_for(size, runs)
+        request_times = []
+        totals = []
+        for _ in range(size_runs):
+            start_total = time.perf_counter()
+            for n in chunks:
+                start = time.perf_counter()
+                cold("/predict/demand/batch", bodies[n])()
+                request_times.append(time.perf_counter() - start)
+            totals.append(time.perf_counter() - start_total)
+        request_ms = np.array(request_times) * 1000
+        catalogue[str(size)] = {
+            "requests": len(chunks),
+            "runs": size_runs,
+            "total_seconds": round(float(np.median(totals)), 3),
+            "request_p50_ms": round(float(np.percentile(request_ms, 50)), 3),
+            "request_p99_ms": round(float(np.percentile(request_ms, 99)), 3),
+            "products_per_second": round(size / float(np.median(totals)), 1)
+        }
+
+    return {
+        "history_days": history_days,
+        "create_features": {"first_call_seconds": features_seconds, **features},
+        "train": {"search": search, "direct_engine": direct_engine, "seconds": train_seconds,
+                  "fit_seconds": payload["result"]["fit_seconds"]},
+        "predict_single": forecasters,
+        "predict_demand_endpoint": endpoint,
+        "predict_demand_catalogue": {"history_days": catalogue_days, "batch_size": batch_size, "sizes": catalogue}
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=SCRIPT_DIR, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "xgboost": xgboost.__version__,
+        "cpu_count": os.cpu_count()
+    }
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and (
+                name.endswith(("_ms", "seconds", "per_second"))):
+            flat[name] = value
+    return flat
+
+
+def compare(before_path, after_path):
+    """Print every timing of two result files with the after / before ratio"""
+    with open(before_path) as f:
+        before = _flatten(json.load(f)["results"])
+    with open(after_path) as f:
+        after = _flatten(json.load(f)["results"])
+    width = max(len(name) for name in after)
+    print(f"{'metric':<{width}}  {'before':>12}  {'after':>12}  {'ratio':>7}")
+    for name, value in after.items():
+        old = before.get(name)
+        ratio = f"{value / old:7.2f}" if old else "      -"
+        print(f"{name:<{width}}  {old if old is not None else '-':>12}  {value:>12}  {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pricing and demand-forecast hot paths")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="catalogue sizes, comma separated (default: 100,1000,10000,100000)")
+    parser.add_argument("--runs", type=int, default=20, help="repetitions per latency measurement")
+    parser.add_argument("--train-samples", type=int, default=1000, help="pricing training set size")
+    parser.add_argument("--gp-runs", type=int, default=3, help="repetitions for gp_minimize latencies")
+    parser.add_argument("--gp-max-products", type=int, default=10, help="batch size for the gp optimizer")
+    parser.add_argument("--history-days", type=int, default=730, help="history of the demand model")
+    parser.add_argument("--catalogue-days", type=int, default=90, help="history per product in the catalogue sweep")
+    parser.add_argument("--batch-size", type=int, default=1000, help="products per /predict/demand/batch request")
+    parser.add_argument("--search", default="halving", choices=api.RECURSIVE_SEARCHES[:2])
+    parser.add_argument("--direct-engine", default="native", choices=api.DIRECT_ENGINES)
+    parser.add_argument("--only", choices=("pricing", "demand"), help="run one of the two suites")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    output = os.path.abspath(args.output)
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        # The models print progress on every call
+        with contextlib.redirect_stdout(io.StringIO()):
+            if args.only in (None, "pricing"):
+                results["pricing"] = bench_pricing(sizes, args.train_samples, args.runs,
+                                                   args.gp_runs, args.gp_max_products)
+            if args.only in (None, "demand"):
+                results["demand"] = bench_demand(sizes, args.runs, args.history_days, args.catalogue_days,
+                                                 args.batch_size, args.search, args.direct_engine)
+
+    report = {"environment": environment(), "config": vars(args) | {"sizes": sizes}, "results": results}
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# backend/ml_models/feature_store.py
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+
+class FeatureStore:
+    """
+    Per-product window state of the demand features, persisted in SQLite.
+
+    For every product it keeps what the forecasters need from the history:
+    the last capacity + 1 quantities, the running EWM (pandas adjust=True
+    recursion) before and after the last day, per day-of-week sums and
+    counts, and the series length and dates. New days are folded in one at
+    a time, so a request only pays for the days added since the last one
+    instead of rebuilding features over the whole history.
+    """
+
+    def __init__(self, path, capacity, ewm_span):
+        self.path = path
+        self.capacity = capacity
+        self.ewm_decay = 1.0 - 2.0 / (ewm_span + 1)
+        self._lock = threading.Lock()
+        self._created = False
+
+    def _connect(self):
+        """Connection to the store; the table is created on first use"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._created:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS product_features ("
+                "product_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._created = True
+        return conn
+
+    def _empty_state(self):
+        return {
+            'first_date': None, 'last_date': None, 'count': 0,
+            'tail': [], 'total': 0.0,
+            'dow_sum': [0.0] * 7, 'dow_count': [0] * 7,
+            'ewm': None, 'ewm_weight': 0.0,
+            'ewm_before_last': None, 'ewm_weight_before_last': 0.0
+        }
+
+    def _append(self, state, dates, values):
+        """Fold new (date, quantity) days into a state, in place"""
+        for date, value in zip(dates, values):
+            value = float(value)
+            if state['count'] == 0:
+                state['first_date'] = date.isoformat()
+            state['last_date'] = date.isoformat()
+            state['count'] += 1
+            state['tail'].append(value)
+            del state['tail'][:-(self.capacity + 1)]
+            state['total'] += value
+            state['dow_sum'][date.dayofweek] += value
+            state['dow_count'][date.dayofweek] += 1
+
+            state['ewm_before_last'] = state['ewm']
+            state['ewm_weight_before_last'] = state['ewm_weight']
+            if state['ewm'] is None:
+                state['ewm'], state['ewm_weight'] = value, 1.0
+            else:
+                weight = state['ewm_weight'] * self.ewm_decay
+                if state['ewm'] != value:
+                    state['ewm'] = (weight * state['ewm'] + value) / (weight + 1.0)
+                state['ewm_weight'] = weight + 1.0
+        return state
+
+    def get_many(self, product_ids):
+        """Stored states for these products ({product_id: state}, missing ones left out)"""
+        keys = [str(pid) for pid in product_ids]
+        if not keys:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT product_id, state FROM product_features WHERE product_id IN ({','.join('?' * len(keys))})",
+                keys
+            ).fetchall()
+        return {product_id: json.loads(state) for product_id, state in rows}
+
+    def invalidate(self, product_ids):
+        """Drop the stored states of these products, e.g. after their past sales were corrected; returns how many"""
+        keys = [str(pid) for pid in product_ids]
+        if not keys:
+            return 0
+        with self._lock, self._connect() as conn:
+            return conn.execute(
+                f"DELETE FROM product_features WHERE product_id IN ({','.join('?' * len(keys))})",
+                keys
+            ).rowcount
+
+    def put_many(self, states):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO product_features (product_id, state, updated_at) VALUES (?, ?, ?)",
+                [(str(pid), json.dumps(state), now) for pid, state in states.items()]
+            )
+
+    def sync(self, series):
+        """
+        Bring the stored state of every product up to date with its history.
+
+        series maps product id -> DataFrame (date, quantity_sold) in date order.
+        Days after the stored last date are appended. The state is rebuilt
+        from scratch if the history up to the stored last date is not the
+        one it was built from: a different first date or number of days, or
+        an edited value among the last capacity + 1 days (the lag and rolling
+        windows). The check costs the same for any history length, so edits
+        further back are not seen; whoever corrects them calls invalidate()
+        (POST /features/invalidate). Returns {product_id: state}.
+        """
+        stored = self.get_many(series)
+        states, changed = {}, {}
+        for product_id, df in series.items():
+            dates = pd.DatetimeIndex(df["date"])
+            values = df["quantity_sold"].to_numpy(dtype=np.float64)
+            state = stored.get(str(product_id))
+
+            if state is not None:
+                known = int(dates.searchsorted(pd.Timestamp(state['last_date']), side='right'))
+                tail = state['tail']
+                if (len(dates) == 0 or dates[0] != pd.Timestamp(state['first_date'])
+                        or known != state['count']
+                        or not np.array_equal(values[known - len(tail):known], tail)):
+                    state = None
+                elif known < len(dates):
+                    changed[product_id] = self._append(state, dates[known:], values[known:])
+
+            if state is None:
+                state = changed[product_id] = self._append(self._empty_state(), dates, values)
+            states[product_id] = state
+
+        if changed:
+            self.put_many(changed)
+        return states
@@ -0,0 +1,96 @@
+# backend/ml_models/forecast_cache.py
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from stage_metrics import metrics
+
+
+class ForecastCache:
+    """
+    In-memory LRU cache of per-product demand forecasts with a TTL.
+
+    Entries are keyed by a fingerprint of everything a product's forecast
+    depends on: its id (the global model's product_code feature), its full
+    history (the day-of-week anchors, the EWM and the time index look past
+    the lag/rolling tail), its category, the horizon and the model name and
+    snapshot version. A new snapshot therefore never
+    serves old entries; invalidate() drops them at once when new models are
+    published. Values are the unrounded forecast arrays. The counters and
+    the size also go to the process metrics (ml_forecast_cache_*).
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(model_name, model_version, days_to_forecast, product_id, df, category=None):
+        """Fingerprint of one product's forecast inputs"""
+        digest = hashlib.sha1(repr(
+            (model_name, model_version, int(days_to_forecast), str(product_id), category)
+        ).encode())
+        digest.update(df["date"].to_numpy(dtype="datetime64[ns]").tobytes())
+        digest.update(df["quantity_sold"].to_numpy(dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """(last_date, predicted) for this key, or None if missing or expired"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self.entries[key]
+                self.expirations += 1
+                metrics.count('ml_forecast_cache_expirations_total')
+                metrics.gauge('ml_forecast_cache_entries', len(self.entries))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                metrics.count('ml_forecast_cache_misses_total')
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            metrics.count('ml_forecast_cache_hits_total')
+            return entry[1], entry[2]
+
+    def put(self, key, last_date, predicted):
+        with self._lock:
+            self.entries[key] = (time.monotonic(), last_date, np.array(predicted, dtype=np.float64))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+                metrics.count('ml_forecast_cache_evictions_total')
+            metrics.gauge('ml_forecast_cache_entries', len(self.entries))
+
+    def invalidate(self):
+        """Drop every entry, e.g. after new models were published"""
+        with self._lock:
+            self.entries.clear()
+            self.invalidations += 1
+            metrics.count('ml_forecast_cache_invalidations_total')
+            metrics.gauge('ml_forecast_cache_entries', 0)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -1,17 +1,17 @@
 import os
-from pricing_model import SmartPricingModel, generate_synthetic_training_data
+from pricing_model import SmartPricingModel, generate_synthetic_training_columns
 
 def main():
     print("Initializing pricing model...")
     
     # Generate synthetic training data
     print("Generating synthetic training data...")
-    training_data = generate_synthetic_training_data(1000)
+    training_data = generate_synthetic_training_columns(1000)
     
     # Create and train model
     print("Training model...")
     model = SmartPricingModel()
-    result = model.train(training_data)
+    result = model.train_columns(training_data)
     
     print(f"Training completed: {result}")
     
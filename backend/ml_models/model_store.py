@@ -0,0 +1,238 @@
+# backend/ml_models/model_store.py
+import os
+import glob
+import json
+import time
+import threading
+import joblib
+from stage_metrics import metrics
+
+# Loaded artifacts for this process, keyed by absolute path
+_artifacts = {}
+_lock = threading.Lock()
+
+
+def _resident_bytes():
+    """Resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _stage_artifact(obj, filepath):
+    """Write an artifact next to its target; returns the temp path to swap in"""
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    joblib.dump(obj, tmp_path, compress=0)
+    return tmp_path
+
+
+def save_artifact(obj, filepath):
+    """
+    Save a model artifact uncompressed, so its numpy arrays can be memory-mapped
+
+    The file is written next to the target and swapped in with os.replace, so
+    readers never see a half-written pickle.
+    """
+    os.replace(_stage_artifact(obj, filepath), filepath)
+    return filepath
+
+
+def load_artifact(filepath, mmap_mode='r'):
+    """
+    Load a model artifact once per process
+
+    Numpy arrays inside the pickle are memory-mapped read-only, so their pages
+    come from the OS page cache and are shared between worker processes. The
+    artifact is reloaded only when the file's mtime or size changes.
+    """
+    path = os.path.abspath(filepath)
+    stat = os.stat(path)
+    file_key = (stat.st_mtime_ns, stat.st_size)
+
+    entry = _artifacts.get(path)
+    if entry is not None and entry['file_key'] == file_key:
+        return entry['artifact']
+
+    with _lock:
+        entry = _artifacts.get(path)
+        if entry is not None and entry['file_key'] == file_key:
+            return entry['artifact']
+
+        rss_before = _resident_bytes()
+        start = time.perf_counter()
+        artifact = joblib.load(path, mmap_mode=mmap_mode)
+        load_seconds = time.perf_counter() - start
+        rss_after = _resident_bytes()
+        metrics.observe('model_load', load_seconds)
+        metrics.count('ml_model_loads_total', artifact=os.path.basename(path))
+
+        _artifacts[path] = {
+            'artifact': artifact,
+            'file_key': file_key,
+            'stats': {
+                'path': path,
+                'file_bytes': stat.st_size,
+                'load_seconds': round(load_seconds, 4),
+                'resident_bytes': (rss_after - rss_before) if rss_before is not None else None,
+                'mmap_mode': mmap_mode,
+                'loaded_at': time.time()
+            }
+        }
+        return artifact
+
+
+def artifact_stats():
+    """Load time and resident size of every artifact loaded in this process"""
+    return [entry['stats'] for entry in _artifacts.values()]
+
+
+class ModelRegistry:
+    """
+    In-memory set of named model artifacts that are swapped atomically
+
+    A snapshot ({'version', 'models', ...}) is replaced as a whole, so a
+    request that reads the snapshot once always sees a consistent set of
+    models. publish() writes every artifact under a new versioned file name,
+    then swaps in a manifest ({'version', 'files'}) with a single os.replace:
+    the set on disk changes in one step, never file by file. Every snapshot()
+    stats the manifest and reloads when it changed, so each worker process
+    serves the new set from its next request on, not only the one that
+    published it. Without a manifest (models saved before it was added) the
+    plain paths are loaded. on_load(models), if given, is applied to every
+    model set before it is swapped in.
+    """
+
+    def __init__(self, paths, manifest_path, on_load=None):
+        self.paths = dict(paths)
+        self.manifest_path = manifest_path
+        self.on_load = on_load
+        self._snapshot = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_key(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _source_key(self):
+        """Identifies the model set on disk: the manifest, or else the plain files"""
+        manifest_key = self._file_key(self.manifest_path)
+        if manifest_key is not None:
+            return ('manifest', manifest_key)
+        return ('paths', tuple(self._file_key(path) for path in self.paths.values()))
+
+    def _swap(self, models, files, source_key, manifest_version, source):
+        if self.on_load is not None:
+            self.on_load(models)
+        previous = self._snapshot
+        self._version += 1
+        self._snapshot = {
+            'version': self._version,
+            'manifest_version': manifest_version,
+            'models': models,
+            'files': files,
+            'source_key': source_key,
+            'source': source,
+            'loaded_at': time.time()
+        }
+        # Replaced versions are not loaded again by this process
+        if previous is not None:
+            for path in set(previous['files'].values()) - set(files.values()):
+                _artifacts.pop(os.path.abspath(path), None)
+
+    def _refresh(self, source_key):
+        with self._lock:
+            if self._snapshot is not None and self._snapshot['source_key'] == source_key:
+                return
+            if source_key[0] == 'manifest':
+                try:
+                    with open(self.manifest_path) as f:
+                        manifest = json.load(f)
+                    files = {name: manifest['files'][name] for name in self.paths}
+                    models = {name: load_artifact(path) for name, path in files.items()}
+                except (OSError, ValueError, KeyError):
+                    # Replaced or cleaned up while loading; keep serving what is in memory
+                    return
+                self._swap(models, files, source_key, manifest['version'], 'disk')
+            else:
+                if any(key is None for key in source_key[1]):
+                    # Keep serving what is in memory if files disappear
+                    return
+                models = {name: load_artifact(path) for name, path in self.paths.items()}
+                self._swap(models, dict(self.paths), source_key, None, 'disk')
+
+    def snapshot(self):
+        """Current snapshot, or None while any artifact is missing"""
+        source_key = self._source_key()
+        if self._snapshot is None or self._snapshot['source_key'] != source_key:
+            self._refresh(source_key)
+        return self._snapshot
+
+    def publish(self, models):
+        """
+        Save freshly trained artifacts and swap them in without a reload
+
+        Artifacts not in models keep their current files. The previous
+        version's files are kept for processes still loading them; older
+        versions are deleted. Returns the new manifest version.
+        """
+        with self._lock:
+            current = dict(self._snapshot['models']) if self._snapshot is not None else {}
+            current.update(models)
+            previous_files = self._snapshot['files'] if self._snapshot is not None else dict(self.paths)
+
+            manifest_version = f"{time.time_ns()}-{os.getpid()}"
+            files = {}
+            for name, path in self.paths.items():
+                if name in models:
+                    root, ext = os.path.splitext(path)
+                    files[name] = save_artifact(models[name], f"{root}.v{manifest_version}{ext}")
+                else:
+                    files[name] = previous_files[name]
+
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': manifest_version, 'files': files}, f)
+            os.replace(tmp_path, self.manifest_path)
+
+            self._swap(current, files, self._source_key(), manifest_version, 'publish')
+            self._remove_old_versions(set(files.values()) | set(previous_files.values()))
+            return manifest_version
+
+    def _remove_old_versions(self, keep):
+        for path in self.paths.values():
+            root, ext = os.path.splitext(path)
+            for candidate in glob.glob(f"{glob.escape(root)}.v*{ext}"):
+                if candidate not in keep:
+                    try:
+                        os.remove(candidate)
+                    except FileNotFoundError:
+                        pass
+
+    def status(self):
+        """Version, source and file details of the loaded models"""
+        snapshot = self.snapshot()
+        files = snapshot['files'] if snapshot is not None else self.paths
+        file_keys = {name: self._file_key(path) for name, path in files.items()}
+        return {
+            'loaded': snapshot is not None,
+            'version': snapshot['version'] if snapshot is not None else None,
+            'manifest_version': snapshot['manifest_version'] if snapshot is not None else None,
+            'source': snapshot['source'] if snapshot is not None else None,
+            'loaded_at': snapshot['loaded_at'] if snapshot is not None else None,
+            'models': {
+                name: {
+                    'path': os.path.abspath(path),
+                    'mtime': file_keys[name][0] / 1e9 if file_keys[name] else None,
+                    'file_bytes': file_keys[name][1] if file_keys[name] else None
+                }
+                for name, path in files.items()
+            },
+            'artifacts': artifact_stats()
+        }
@@ -1,111 +1,234 @@
 #!/usr/bin/env python3
 # backend/ml_models/predict_price.py
+#
+# Usage:
+#   python predict_price.py            # one-shot: read one product JSON from stdin
+#   python predict_price.py --serve    # worker: newline-delimited JSON requests on stdin,
+#                                      # one JSON response per line on stdout
+#
+# A request is either a single product object, or {"products": [...]} for a
+# batch, which is answered with {"predictions": [...]} in the same order.
+# A batch may also set "optimizer": "gp" (default) | "grid" | "analytic".
+# Either kind may set "mode": "full" (default, the random forest) | "fast"
+# (its distilled surrogate, for interactive calls; see SmartPricingModel).
+# Any request may set "timings": true to get the time per stage back under
+# "timings"; {"metrics": true} is answered with the stage histograms and
+# counters of the worker in the Prometheus text format ({"metrics": "..."}).
 
 import sys
 import json
+import math
 import os
 from pricing_model import SmartPricingModel
+from stage_metrics import metrics
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'pricing_model.pkl')
+
+
+def prepare_product_data(product_data):
+    """Validate required fields and fill defaults for optional ones"""
+
+    # Validate required fields and set defaults for None values
+    required_fields = ['current_price', 'cost_price', 'demand_forecast']
+    for field in required_fields:
+        if field not in product_data or product_data[field] is None:
+            raise ValueError(f"Missing required field: {field}")
+        # Ensure numeric values
+        product_data[field] = float(product_data[field])
+        if not math.isfinite(product_data[field]):
+            raise ValueError(f"{field} must be a finite number")
+
+    # Prices and changes are computed relative to the current price, and the
+    # revenue change relative to current_price * demand_forecast
+    if not product_data['current_price'] > 0:
+        raise ValueError("current_price must be positive")
+    if not product_data['demand_forecast'] > 0:
+        raise ValueError("demand_forecast must be positive")
+
+    # Set defaults for optional fields
+    if 'competitor_prices' not in product_data or not product_data['competitor_prices']:
+        product_data['competitor_prices'] = [product_data['current_price']]
+    else:
+        # Filter out None values and convert to float
+        product_data['competitor_prices'] = [
+            float(p) for p in product_data['competitor_prices']
+            if p is not None
+        ]
+
+    if 'stock_level' not in product_data or product_data['stock_level'] is None:
+        product_data['stock_level'] = 100
+    else:
+        product_data['stock_level'] = int(product_data['stock_level'])
+
+    if 'days_in_stock' not in product_data or product_data['days_in_stock'] is None:
+        product_data['days_in_stock'] = 30
+    else:
+        product_data['days_in_stock'] = int(product_data['days_in_stock'])
+
+    if 'seasonality_index' not in product_data or product_data['seasonality_index'] is None:
+        product_data['seasonality_index'] = 1.0
+    else:
+        product_data['seasonality_index'] = float(product_data['seasonality_index'])
+
+    if 'category_avg_price' not in product_data or product_data['category_avg_price'] is None:
+        product_data['category_avg_price'] = product_data['current_price']
+    else:
+        product_data['category_avg_price'] = float(product_data['category_avg_price'])
+
+    if 'historical_sales' not in product_data or not product_data['historical_sales']:
+        product_data['historical_sales'] = [100]
+    else:
+        product_data['historical_sales'] = [
+            float(s) for s in product_data['historical_sales']
+            if s is not None
+        ]
+
+    return product_data
+
+
+def load_pricing_model(model_path=MODEL_PATH):
+    """Load the trained model, training one on synthetic data if none exists"""
+    model = SmartPricingModel()
+
+    if os.path.exists(model_path):
+        model.load_model(model_path)
+    else:
+        # If model doesn't exist, generate training data and train
+        from pricing_model import generate_synthetic_training_columns
+        model.train_columns(generate_synthetic_training_columns(1000))
+        model.fit_surrogate()
+        model.save_model(model_path)
+
+    return model
+
+
+def error_response(e):
+    """Build the JSON error payload returned to the Node side"""
+    if isinstance(e, json.JSONDecodeError):
+        return {
+            "error": f"Invalid JSON input: {str(e)}",
+            "type": "JSONDecodeError"
+        }
+    return {
+        "error": str(e),
+        "type": type(e).__name__
+    }
+
+
+def predict_batch(model, products, optimizer='gp', mode='full'):
+    """Predict a batch of products in one model call; invalid entries get an error payload"""
+    if not isinstance(products, list):
+        raise ValueError("'products' must be a list")
+
+    results = [None] * len(products)
+    valid_products, valid_indices = [], []
+    for i, product_data in enumerate(products):
+        try:
+            valid_products.append(prepare_product_data(product_data))
+            valid_indices.append(i)
+        except Exception as e:
+            results[i] = error_response(e)
+
+    try:
+        predictions = model.predict_prices(valid_products, use_bayesian=True, optimizer=optimizer, mode=mode)
+    except Exception:
+        # Predict each product on its own, so one bad product does not fail the batch
+        predictions = []
+        for product_data in valid_products:
+            try:
+                predictions.append(model.predict_price(product_data, use_bayesian=True, optimizer=optimizer, mode=mode))
+            except Exception as e:
+                predictions.append(error_response(e))
+    for i, prediction in zip(valid_indices, predictions):
+        results[i] = prediction
+
+    return {'predictions': results}
+
+
+def handle_request(model, request):
+    """Answer a single-product, batch or metrics request"""
+    if isinstance(request, dict) and request.get('metrics'):
+        return {'metrics': metrics.render()}
+
+    timings_requested = isinstance(request, dict) and bool(request.pop('timings', False))
+    mode = request.pop('mode', 'full') if isinstance(request, dict) else 'full'
+    optimizer = 'gp'
+    # Models without a surrogate (saved before it was added, or not distilled
+    # yet after a retrain) answer fast requests with the full forest, still
+    # with the analytic optimizer
+    if mode == 'fast' and model.surrogate is None:
+        mode, optimizer = 'full', 'analytic'
+    with metrics.collect(timings_requested) as timings:
+        if isinstance(request, dict) and 'products' in request:
+            response = predict_batch(model, request['products'], request.get('optimizer', optimizer), mode)
+        else:
+            product_data = prepare_product_data(request)
+            response = model.predict_price(product_data, use_bayesian=True, optimizer=optimizer, mode=mode)
+
+    if timings is not None:
+        response['timings'] = timings
+    return response
+
+
+def serve():
+    """
+    Long-lived worker mode.
+
+    The model is loaded once and kept warm. Each stdin line is one request
+    (a product or a batch); each stdout line is the response, in the same
+    shape as the one-shot mode, or an error payload. The model is reloaded
+    when pricing_model.pkl changes on disk, e.g. after train_model.py has run.
+    """
+    model = load_pricing_model()
+    model_mtime = os.path.getmtime(MODEL_PATH)
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            current_mtime = os.path.getmtime(MODEL_PATH)
+            if current_mtime != model_mtime:
+                model.load_model(MODEL_PATH)
+                model_mtime = current_mtime
+
+            # NaN/Infinity is not valid JSON; JSON.parse on the Node side rejects the line
+            output = json.dumps(handle_request(model, json.loads(line)), allow_nan=False)
+        except Exception as e:
+            output = json.dumps(error_response(e))
+
+        sys.stdout.write(output + "\n")
+        sys.stdout.flush()
+
 
 def main():
     try:
         # Read input from stdin
         input_data = sys.stdin.read()
-        
+
         if not input_data:
             raise ValueError("No input data received")
-        
+
         # Parse JSON input
-        product_data = json.loads(input_data)
-        
-        # Validate required fields and set defaults for None values
-        required_fields = ['current_price', 'cost_price', 'demand_forecast']
-        for field in required_fields:
-            if field not in product_data or product_data[field] is None:
-                raise ValueError(f"Missing required field: {field}")
-            # Ensure numeric values
-            product_data[field] = float(product_data[field])
-        
-        # Set defaults for optional fields
-        if 'competitor_prices' not in product_data or not product_data['competitor_prices']:
-            product_data['competitor_prices'] = [product_data['current_price']]
-        else:
-            # Filter out None values and convert to float
-            product_data['competitor_prices'] = [
-                float(p) for p in product_data['competitor_prices'] 
-                if p is not None
-            ]
-        
-        if 'stock_level' not in product_data or product_data['stock_level'] is None:
-            product_data['stock_level'] = 100
-        else:
-            product_data['stock_level'] = int(product_data['stock_level'])
-        
-        if 'days_in_stock' not in product_data or product_data['days_in_stock'] is None:
-            product_data['days_in_stock'] = 30
-        else:
-            product_data['days_in_stock'] = int(product_data['days_in_stock'])
-        
-        if 'seasonality_index' not in product_data or product_data['seasonality_index'] is None:
-            product_data['seasonality_index'] = 1.0
-        else:
-            product_data['seasonality_index'] = float(product_data['seasonality_index'])
-        
-        if 'category_avg_price' not in product_data or product_data['category_avg_price'] is None:
-            product_data['category_avg_price'] = product_data['current_price']
-        else:
-            product_data['category_avg_price'] = float(product_data['category_avg_price'])
-        
-        if 'historical_sales' not in product_data or not product_data['historical_sales']:
-            product_data['historical_sales'] = [100]
-        else:
-            product_data['historical_sales'] = [
-                float(s) for s in product_data['historical_sales'] 
-                if s is not None
-            ]
-        
+        request = json.loads(input_data)
+
         # Load or create model
-        model = SmartPricingModel()
-        model_path = os.path.join(os.path.dirname(__file__), 'pricing_model.pkl')
-        
-        if os.path.exists(model_path):
-            model.load_model(model_path)
-        else:
-            # If model doesn't exist, generate training data and train
-            from pricing_model import generate_synthetic_training_data
-            training_data = generate_synthetic_training_data(1000)
-            model.train(training_data)
-            model.save_model(model_path)
-        
-        # Make prediction
-        prediction = model.predict_price(product_data, use_bayesian=True)
-        
+        model = load_pricing_model()
+
+        # Make prediction(s)
+        prediction = handle_request(model, request)
+
         # Output result as JSON
-        print(json.dumps(prediction))
+        print(json.dumps(prediction, allow_nan=False))
         sys.exit(0)
-        
-    except json.JSONDecodeError as e:
-        error_response = {
-            "error": f"Invalid JSON input: {str(e)}",
-            "type": "JSONDecodeError"
-        }
-        print(json.dumps(error_response), file=sys.stderr)
-        sys.exit(1)
-        
-    except ValueError as e:
-        error_response = {
-            "error": str(e),
-            "type": "ValueError"
-        }
-        print(json.dumps(error_response), file=sys.stderr)
-        sys.exit(1)
-        
+
     except Exception as e:
-        error_response = {
-            "error": str(e),
-            "type": type(e).__name__
-        }
-        print(json.dumps(error_response), file=sys.stderr)
+        print(json.dumps(error_response(e)), file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--serve' in sys.argv[1:]:
+        serve()
+    else:
+        main()
@@ -1,19 +1,151 @@
 # backend/ml_services/pricing_model.py
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from skopt import gp_minimize
 from skopt.space import Real
 from skopt.utils import use_named_args
-import joblib
 import json
+import os
+import copy
+import time
 from datetime import datetime
+from model_store import save_artifact, load_artifact
+from stage_metrics import metrics
+
+class ForestUncertainty:
+    """
+    Per-tree predictions of a fitted RandomForestRegressor in one pass.
+    
+    The node values of every tree are flattened into a single array, so a
+    batch is evaluated with one forest.apply() call and one gather instead
+    of a separate predict() call per tree.
+    """
+    def __init__(self, forest):
+        self.forest = forest
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        node_counts = np.array([tree.node_count for tree in trees])
+        self.node_offsets = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+        self.node_values = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+    
+    def tree_predictions(self, X):
+        """(n_samples x n_trees) matrix of per-tree predictions"""
+        leaves = self.forest.apply(X)
+        return self.node_values[leaves + self.node_offsets]
+    
+    def predict(self, X, quantiles=None):
+        """
+        Forest mean, per-tree std and optional quantiles for each row of X
+        
+        Returns:
+        {
+            'mean': array (n_samples,),
+            'std': array (n_samples,),
+            'quantiles': array (n_samples, len(quantiles))  # only if requested
+        }
+        """
+        with metrics.stage('pricing.rf_tree_predictions'):
+            per_tree = self.tree_predictions(X)
+        with metrics.stage('pricing.rf_tree_std'):
+            result = {
+                'mean': per_tree.mean(axis=1),
+                'std': per_tree.std(axis=1)
+            }
+            if quantiles:
+                result['quantiles'] = np.quantile(per_tree, quantiles, axis=1).T
+        return result
+
+
+class DistilledForest:
+    """
+    Compact surrogate of a fitted forest's mean and per-tree std.
+    
+    Two small gradient-boosted models learn the forest's outputs relative to
+    the current price, on the given rows plus jittered copies of them (the
+    price_column of X, the scaled current price, is left as is). Their trees are flattened into
+    node arrays like ForestUncertainty's, so a prediction is one gather per
+    tree level with no sklearn call on the request path.
+    """
+    def __init__(self, X, current_prices, uncertainty, price_column, n_estimators=150, max_depth=4,
+                 copies=4, jitter=0.1, random_state=42):
+        rng = np.random.default_rng(random_state)
+        noise = rng.normal(0.0, jitter, (copies,) + X.shape)
+        noise[:, :, price_column] = 0.0
+        X_fit = np.vstack([X] + list(X + noise))
+        prices_fit = np.tile(current_prices, copies + 1)
+        
+        forest_output = uncertainty.predict(X_fit)
+        self.depth = max_depth
+        self.trees = {}
+        for target in ('mean', 'std'):
+            booster = GradientBoostingRegressor(
+                n_estimators=n_estimators, max_depth=max_depth, learning_rate=0.1, random_state=random_state
+            )
+            booster.fit(X_fit, forest_output[target] / prices_fit)
+            self.trees[target] = self._flatten(booster)
+    
+    @staticmethod
+    def _flatten(booster):
+        """Node arrays of every tree; leaves point to themselves so all paths have the same length"""
+        trees = [estimator.tree_ for estimator in booster.estimators_[:, 0]]
+        node_counts = np.array([tree.node_count for tree in trees])
+        roots = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+        offsets = np.repeat(roots, node_counts)
+        index = np.arange(node_counts.sum())
+        
+        is_leaf = np.concatenate([tree.children_left for tree in trees]) < 0
+        left = np.where(is_leaf, index, np.concatenate([tree.children_left for tree in trees]) + offsets)
+        right = np.where(is_leaf, index, np.concatenate([tree.children_right for tree in trees]) + offsets)
+        return {
+            'roots': roots,
+            'feature': np.where(is_leaf, 0, np.concatenate([tree.feature for tree in trees])),
+            'threshold': np.where(is_leaf, np.inf, np.concatenate([tree.threshold for tree in trees])),
+            'left': left,
+            'right': right,
+            'value': np.concatenate([tree.value[:, 0, 0] for tree in trees]) * booster.learning_rate,
+            'init': float(np.ravel(booster.init_.constant_)[0])
+        }
+    
+    def _evaluate(self, flat, X):
+        # Trees split on float32 inputs, as in sklearn
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(flat['roots'], (len(X), len(flat['roots'])))
+        for _ in range(self.depth):
+            go_left = X[rows, flat['feature'][node]] <= flat['threshold'][node]
+            node = np.where(go_left, flat['left'][node], flat['right'][node])
+        return flat['init'] + flat['value'][node].sum(axis=1)
+    
+    def predict(self, X, current_prices):
+        """Surrogate forest mean and std for each row of X (same keys as ForestUncertainty.predict)"""
+        return {
+            'mean': self._evaluate(self.trees['mean'], X) * current_prices,
+            'std': np.maximum(self._evaluate(self.trees['std'], X) * current_prices, 0.0)
+        }
+
 
 class SmartPricingModel:
+    OPTIMIZERS = ('gp', 'grid', 'analytic')
+    # 'full': the random forest; 'fast': its distilled surrogate (DistilledForest)
+    MODES = ('full', 'fast')
+    # Rows the surrogate is distilled from (a random sample of bigger training sets)
+    SURROGATE_MAX_ROWS = 500
+    # Mean relative gap to the forest past which an incremental fit asks for a new surrogate
+    SURROGATE_MAX_DRIFT = 0.05
+    # Incremental retraining: trees grown per call, and the forest size kept
+    INCREMENTAL_TREES = 50
+    MAX_TREES = 200
+    
     def __init__(self):
         self.model = None
+        self._uncertainty = None
+        self.surrogate = None
+        self.surrogate_report = None
+        # Random sample of the training features, kept for distilling the surrogate
+        self.training_sample = None
+        self.model_version = None
         self.scaler = StandardScaler()
         self.feature_names = [
             'current_price',
@@ -47,63 +179,181 @@ class SmartPricingModel:
         }
         """
         
+        return self.prepare_feature_matrix([product_data])
+
+    def prepare_feature_matrix(self, products):
+        """Prepare an (N x n_features) feature frame for a batch of products, in input order"""
+        return pd.DataFrame(self.build_feature_array(products), columns=self.feature_names)
+    
+    def build_feature_array(self, products):
+        """
+        NumPy-native feature builder
+        
+        Writes the features of all products straight into one preallocated
+        float64 array (one row per product, columns in feature_names order),
+        without building per-product dicts or DataFrames.
+        """
+        n = len(products)
+        X = np.empty((n, len(self.feature_names)), dtype=np.float64)
+        
+        def column(getter):
+            return np.fromiter((getter(p) for p in products), dtype=np.float64, count=n)
+        
+        current_prices = column(lambda p: p['current_price'])
+        
         # Calculate competitor statistics
-        comp_prices = product_data.get('competitor_prices', [product_data['current_price']])
-        competitor_avg = np.mean(comp_prices) if comp_prices else product_data['current_price']
-        competitor_min = np.min(comp_prices) if comp_prices else product_data['current_price']
-        competitor_max = np.max(comp_prices) if comp_prices else product_data['current_price']
+        competitor_avg, competitor_min, competitor_max = self._competitor_stats(
+            [p.get('competitor_prices') or [] for p in products],
+            current_prices
+        )
         
         # Calculate price elasticity from historical data
-        historical_sales = product_data.get('historical_sales', [100])
-        price_elasticity = self._calculate_elasticity(historical_sales)
-        
-        # Get category average (you'll need to maintain this in your database)
-        category_avg = product_data.get('category_avg_price', product_data['current_price'])
+        price_elasticity = self._calculate_elasticities(
+            [p.get('historical_sales') or [] for p in products]
+        )
         
-        features = {
-            'current_price': product_data['current_price'],
-            'cost_price': product_data['cost_price'],
-            'demand_forecast': product_data['demand_forecast'],
+        columns = {
+            'current_price': current_prices,
+            'cost_price': column(lambda p: p['cost_price']),
+            'demand_forecast': column(lambda p: p['demand_forecast']),
             'competitor_avg_price': competitor_avg,
             'competitor_min_price': competitor_min,
             'competitor_max_price': competitor_max,
-            'stock_level': product_data.get('stock_level', 100),
-            'days_in_stock': product_data.get('days_in_stock', 30),
-            'seasonality_index': product_data.get('seasonality_index', 1.0),
-            'category_avg_price': category_avg,
+            'stock_level': column(lambda p: p.get('stock_level', 100)),
+            'days_in_stock': column(lambda p: p.get('days_in_stock', 30)),
+            'seasonality_index': column(lambda p: p.get('seasonality_index', 1.0)),
+            # Get category average (you'll need to maintain this in your database)
+            'category_avg_price': column(lambda p: p.get('category_avg_price', p['current_price'])),
             'price_elasticity': price_elasticity
         }
         
-        return pd.DataFrame([features])[self.feature_names]
+        for j, name in enumerate(self.feature_names):
+            X[:, j] = columns[name]
+        
+        return X
     
-    def _calculate_elasticity(self, historical_sales):
-        """Calculate price elasticity of demand from historical sales"""
-        if len(historical_sales) < 2:
-            return 1.0
+    def build_columnar_feature_array(self, columns):
+        """
+        Feature builder for columnar input (see train_model.py)
         
-        # Simple elasticity: % change in quantity / % change in price
-        # Higher elasticity = more price sensitive
-        sales_volatility = np.std(historical_sales) / (np.mean(historical_sales) + 1)
-        return min(2.0, max(0.5, sales_volatility))
+        columns: dict of cleaned 1-D arrays for the scalar fields, plus
+        NaN-padded 2-D arrays 'competitor_prices' (N x k) and
+        'historical_sales' (N x h). Rows with no competitor prices use their
+        own price, rows with fewer than 2 sales points get elasticity 1.0.
+        """
+        n = len(columns['current_price'])
+        X = np.empty((n, len(self.feature_names)), dtype=np.float64)
+        current_prices = columns['current_price']
+        
+        # Calculate competitor statistics over the non-NaN entries of each row
+        comp_prices = columns['competitor_prices']
+        comp_valid = ~np.isnan(comp_prices)
+        comp_count = comp_valid.sum(axis=1)
+        has_comp = comp_count > 0
+        comp_avg = np.where(comp_valid, comp_prices, 0.0).sum(axis=1) / np.maximum(comp_count, 1)
+        comp_min = np.where(comp_valid, comp_prices, np.inf).min(axis=1, initial=np.inf)
+        comp_max = np.where(comp_valid, comp_prices, -np.inf).max(axis=1, initial=-np.inf)
+        
+        # Calculate price elasticity from historical data
+        sales = columns['historical_sales']
+        sales_valid = ~np.isnan(sales)
+        sales_count = sales_valid.sum(axis=1)
+        sales_mean = np.where(sales_valid, sales, 0.0).sum(axis=1) / np.maximum(sales_count, 1)
+        sales_var = np.where(sales_valid, (sales - sales_mean[:, None]) ** 2, 0.0).sum(axis=1) / np.maximum(sales_count, 1)
+        sales_volatility = np.sqrt(sales_var) / (sales_mean + 1)
+        
+        features = {
+            'current_price': current_prices,
+            'cost_price': columns['cost_price'],
+            'demand_forecast': columns['demand_forecast'],
+            'competitor_avg_price': np.where(has_comp, comp_avg, current_prices),
+            'competitor_min_price': np.where(has_comp, comp_min, current_prices),
+            'competitor_max_price': np.where(has_comp, comp_max, current_prices),
+            'stock_level': columns['stock_level'],
+            'days_in_stock': columns['days_in_stock'],
+            'seasonality_index': columns['seasonality_index'],
+            'category_avg_price': columns['category_avg_price'],
+            'price_elasticity': np.where(sales_count >= 2, np.clip(sales_volatility, 0.5, 2.0), 1.0)
+        }
+        
+        for j, name in enumerate(self.feature_names):
+            X[:, j] = features[name]
+        
+        return X
+    
+    @staticmethod
+    def _rows_by_length(lists):
+        """
+        Group ragged lists by length, yielding (length, row_indices, 2-D array)
+        
+        Reducing each equal-length group along axis 1 gives exactly the same
+        values as np.mean/np.std/... on each list separately.
+        """
+        lengths = np.fromiter((len(values) for values in lists), dtype=np.intp, count=len(lists))
+        for length in np.unique(lengths):
+            rows = np.flatnonzero(lengths == length)
+            values = np.array([lists[i] for i in rows], dtype=np.float64).reshape(len(rows), length)
+            yield length, rows, values
+    
+    def _competitor_stats(self, competitor_prices, current_prices):
+        """Competitor mean/min/max per product; products without competitors use their own price"""
+        competitor_avg = current_prices.copy()
+        competitor_min = current_prices.copy()
+        competitor_max = current_prices.copy()
+        
+        for length, rows, prices in self._rows_by_length(competitor_prices):
+            if length == 0:
+                continue
+            competitor_avg[rows] = prices.mean(axis=1)
+            competitor_min[rows] = prices.min(axis=1)
+            competitor_max[rows] = prices.max(axis=1)
+        
+        return competitor_avg, competitor_min, competitor_max
     
-    def train(self, training_data):
+    def _calculate_elasticities(self, historical_sales):
+        """Calculate price elasticity of demand from historical sales, per product"""
+        elasticities = np.ones(len(historical_sales))
+        
+        for length, rows, sales in self._rows_by_length(historical_sales):
+            if length < 2:
+                continue
+            # Simple elasticity: % change in quantity / % change in price
+            # Higher elasticity = more price sensitive
+            sales_volatility = sales.std(axis=1) / (sales.mean(axis=1) + 1)
+            elasticities[rows] = np.clip(sales_volatility, 0.5, 2.0)
+        
+        return elasticities
+    
+    def train(self, training_data, incremental=False):
         """
         Train the Random Forest model
         
         training_data: List of dicts with product data + 'optimal_price' and 'revenue_generated'
+        incremental: refresh the current forest with this data (fit_incremental)
+            instead of training a new one
         """
         # Prepare features and targets
-        X = []
-        y = []
+        X = self.build_feature_array(training_data)
+        y = np.fromiter((data['optimal_price'] for data in training_data), dtype=np.float64, count=len(training_data))
         
-        for data in training_data:
-            features = self.prepare_features(data)
-            X.append(features.values[0])
-            y.append(data['optimal_price'])
-        
-        X = np.array(X)
-        y = np.array(y)
+        fit = self.fit_incremental if incremental else self.fit_features
+        return fit(X, y)
+    
+    def train_columns(self, columns, incremental=False):
+        """
+        Train on columnar data (see build_columnar_feature_array), plus an
+        (N,) 'optimal_price' array, without building per-row dicts
+        """
+        X = self.build_columnar_feature_array(columns)
+        fit = self.fit_incremental if incremental else self.fit_features
+        return fit(X, np.asarray(columns['optimal_price'], dtype=np.float64))
+    
+    def fit_features(self, X, y):
+        """
+        Train the Random Forest model on a prebuilt feature matrix
         
+        X: (N x n_features) array in feature_names order, y: (N,) optimal prices
+        """
         # Scale features
         X_scaled = self.scaler.fit_transform(X)
         
@@ -118,20 +368,210 @@ class SmartPricingModel:
         )
         
         self.model.fit(X_scaled, y)
+        self._uncertainty = None
+        self.model_version = datetime.now().isoformat()
+        
+        # The surrogate of the previous forest no longer applies; fit_surrogate
+        # distills a new one from the sample kept here
+        self.surrogate = None
+        self.surrogate_report = None
+        self._remember_sample(X)
         
         # Calculate feature importances
         importances = dict(zip(self.feature_names, self.model.feature_importances_))
         
         return {
             'status': 'success',
-            'n_samples': len(training_data),
-            'feature_importances': importances
+            'n_samples': len(y),
+            'feature_importances': importances,
+            'needs_distill': True
         }
     
-    def predict_price(self, product_data, use_bayesian=True):
+    def _remember_sample(self, X, random_state=42):
+        """Keep (and return) at most SURROGATE_MAX_ROWS random rows of X as the training sample"""
+        if len(X) > self.SURROGATE_MAX_ROWS:
+            rng = np.random.default_rng(random_state)
+            X = X[np.sort(rng.choice(len(X), self.SURROGATE_MAX_ROWS, replace=False))]
+        self.training_sample = np.array(X, dtype=np.float64)
+        return self.training_sample
+    
+    def fit_incremental(self, X, y, n_new_trees=None, max_trees=None):
+        """
+        Refresh the trained forest with a window of recent data
+        
+        Keeps the existing trees, grows n_new_trees (INCREMENTAL_TREES) more
+        on X, y with warm_start and retires the oldest trees beyond max_trees
+        (MAX_TREES), so the cost scales with the window, not the history.
+        The scaler stays fixed, since the kept trees split on features scaled
+        by it. The kept trees still answer for older data, so the window is
+        merged into the stored training sample rather than replacing it.
+        
+        The surrogate is kept, not distilled again: its drift is the mean
+        relative gap to the refreshed forest on the new sample, and the
+        result asks for a distill step (needs_distill) only when that passes
+        SURROGATE_MAX_DRIFT. Trains from scratch when there is no forest yet.
+        
+        The forest is refit as a copy: a loaded model is shared with every
+        other user of the same artifact (load_artifact).
+        """
+        if self.model is None:
+            return self.fit_features(X, y)
+        
+        n_new_trees = n_new_trees or self.INCREMENTAL_TREES
+        max_trees = max_trees or self.MAX_TREES
+        X_scaled = self.scaler.transform(X)
+        
+        forest = copy.copy(self.model)
+        forest.estimators_ = list(self.model.estimators_)
+        n_kept = len(forest.estimators_)
+        forest.set_params(warm_start=True, n_estimators=n_kept + n_new_trees)
+        forest.fit(X_scaled, y)
+        
+        # estimators_ is in training order, oldest first
+        n_retired = max(0, len(forest.estimators_) - max_trees)
+        forest.estimators_ = forest.estimators_[n_retired:]
+        forest.set_params(warm_start=False, n_estimators=len(forest.estimators_))
+        
+        self.model = forest
+        self._uncertainty = None
+        self.model_version = datetime.now().isoformat()
+        
+        importances = dict(zip(self.feature_names, self.model.feature_importances_))
+        
+        # Models saved before the sample was kept start it from the window
+        if self.training_sample is not None:
+            X = np.vstack([self.training_sample, X])
+        surrogate_drift = self._surrogate_drift(self._remember_sample(X))
+        
+        return {
+            'status': 'success',
+            'mode': 'incremental',
+            'n_samples': len(y),
+            'trees_added': n_new_trees,
+            'trees_retired': n_retired,
+            'n_trees': len(forest.estimators_),
+            'feature_importances': importances,
+            'surrogate_drift': surrogate_drift,
+            'needs_distill': surrogate_drift is None or surrogate_drift > self.SURROGATE_MAX_DRIFT
+        }
+    
+    def _surrogate_drift(self, X):
+        """Mean relative gap between the surrogate and the forest mean on X, or None without a surrogate"""
+        if self.surrogate is None or len(X) == 0:
+            return None
+        X_scaled = self.scaler.transform(X)
+        price_column = self.feature_names.index('current_price')
+        fast = self.surrogate.predict(X_scaled, X[:, price_column])['mean']
+        full = self.uncertainty.predict(X_scaled)['mean']
+        return round(float(np.mean(np.abs(fast - full) / np.abs(full))), 4)
+    
+    def fit_surrogate(self, X=None, holdout=0.2, random_state=42):
+        """
+        Distill the trained forest into the DistilledForest used by mode='fast'
+        
+        Training does not distill (it takes longer than fitting the forest);
+        this runs as its own step, e.g. train_model.py --distill, on X or the
+        training sample kept by the last fit. The held-out part measures the
+        accuracy gap against the forest on what the responses serve. With
+        use_bayesian (the default) the price comes from the optimizer alone
+        and the surrogate only sets the spread, so the report covers the
+        spread, the confidence it drives, and the suggested price and range
+        of each mode with its batch optimizer (fast: analytic, full: grid).
+        The forest mean is compared too; it is the price when use_bayesian is
+        off. Returns the report (also kept in self.surrogate_report), or None
+        when there are too few rows to distill from.
+        """
+        if X is None:
+            X = self.training_sample
+        self.surrogate = None
+        self.surrogate_report = None
+        if X is None or len(X) < 20:
+            return None
+        
+        rng = np.random.default_rng(random_state)
+        if len(X) > self.SURROGATE_MAX_ROWS:
+            X = X[rng.choice(len(X), self.SURROGATE_MAX_ROWS, replace=False)]
+        X_fit, X_holdout = train_test_split(X, test_size=holdout, random_state=random_state)
+        
+        price_column = self.feature_names.index('current_price')
+        surrogate = DistilledForest(self.scaler.transform(X_fit), X_fit[:, price_column], self.uncertainty, price_column)
+        
+        # Accuracy gap on the held-out rows
+        X_holdout_scaled = self.scaler.transform(X_holdout)
+        features = {name: X_holdout[:, j] for j, name in enumerate(self.feature_names)}
+        current_prices = features['current_price']
+        full = self.uncertainty.predict(X_holdout_scaled)
+        fast = surrogate.predict(X_holdout_scaled, current_prices)
+        relative_error = np.abs(fast['mean'] - full['mean']) / np.abs(full['mean'])
+        min_prices = features['cost_price'] * 1.15
+        max_prices = current_prices * 1.5
+        base_prices = {mode: np.clip(output['mean'], min_prices, max_prices) for mode, output in (('full', full), ('fast', fast))}
+        
+        # Only the variance part of the confidence depends on the model
+        confidence_error = np.array([
+            abs(self._calculate_confidence(fast_std, {'current_price': c}) -
+                self._calculate_confidence(full_std, {'current_price': c}))
+            for fast_std, full_std, c in zip(fast['std'], full['std'], current_prices)
+        ])
+        
+        # Served price and range of each mode with its own optimizer. The
+        # optimizers take the request's price_elasticity (default 1.0, which
+        # is what the Node side serves), not the elasticity feature.
+        optimizer_args = (
+            current_prices, features['demand_forecast'], np.ones(len(X_holdout)),
+            features['competitor_avg_price'], min_prices, max_prices
+        )
+        fast_prices = self._analytic_optimize(*optimizer_args)
+        full_prices = self._grid_optimize(*optimizer_args)
+        range_error = np.concatenate([
+            np.abs(np.maximum(min_prices, fast_prices - fast['std']) -
+                   np.maximum(min_prices, full_prices - full['std'])),
+            np.abs(np.minimum(max_prices, fast_prices + fast['std']) -
+                   np.minimum(max_prices, full_prices + full['std']))
+        ]) / np.tile(current_prices, 2)
+        
+        # Single-row latency of both paths, in microseconds
+        row = X_holdout_scaled[:1]
+        timings = {}
+        for name, predict in (('full', lambda: self.uncertainty.predict(row)),
+                              ('fast', lambda: surrogate.predict(row, current_prices[:1]))):
+            predict()
+            runs = []
+            for _ in range(20):
+                start = time.perf_counter()
+                predict()
+                runs.append(time.perf_counter() - start)
+            timings[name] = round(float(np.median(runs)) * 1e6, 1)
+        
+        self.surrogate = surrogate
+        self.surrogate_report = {
+            'holdout_rows': len(X_holdout),
+            'std_abs_error': round(float(np.mean(np.abs(fast['std'] - full['std']))), 2),
+            'confidence_abs_error': round(float(confidence_error.mean()), 2),
+            'suggested_price_rel_error': round(float(np.mean(np.abs(fast_prices - full_prices) / full_prices)), 4),
+            'price_range_rel_error': round(float(range_error.mean()), 4),
+            'mean_abs_error': round(float(np.mean(np.abs(fast['mean'] - full['mean']))), 2),
+            'mean_rel_error': round(float(relative_error.mean()), 4),
+            'p95_rel_error': round(float(np.quantile(relative_error, 0.95)), 4),
+            'base_price_rel_error': round(float(np.mean(np.abs(base_prices['fast'] - base_prices['full']) / base_prices['full'])), 4),
+            'full_predict_us': timings['full'],
+            'fast_predict_us': timings['fast']
+        }
+        return self.surrogate_report
+    
+    def predict_price(self, product_data, use_bayesian=True, optimizer='gp', mode='full'):
         """
         Predict optimal price for a product
         
+        optimizer: how the price is fine-tuned when use_bayesian is on
+            'gp'       - skopt gp_minimize, 20 calls per product (default)
+            'grid'     - dense price grid evaluated with NumPy for the whole batch
+            'analytic' - closed-form stationary points of the objective, vectorized
+        mode: 'full' uses the random forest (default); 'fast' uses its distilled
+            surrogate and the analytic optimizer in place of 'gp', for
+            interactive single-product calls. The results then carry the
+            surrogate's accuracy gap under 'surrogate'.
+        
         Returns:
         {
             'suggested_price': float,
@@ -141,34 +581,124 @@ class SmartPricingModel:
             'impact': dict
         }
         """
+        return self.predict_prices([product_data], use_bayesian=use_bayesian, optimizer=optimizer, mode=mode)[0]
+    
+    def predict_prices(self, products, use_bayesian=True, quantiles=None, optimizer='gp', mode='full'):
+        """
+        Predict optimal prices for a batch of products
+        
+        Builds one feature matrix for all products, so scaling and the
+        Random Forest prediction run as a single vectorized call.
+        
+        quantiles: optional list of probabilities (e.g. [0.1, 0.9]); when given,
+        each result also carries 'price_quantiles' from the per-tree spread.
+        
+        Returns a list of predict_price() results in input order.
+        """
         if self.model is None:
             raise ValueError("Model not trained. Call train() first or load a trained model.")
         
+        if optimizer not in self.OPTIMIZERS:
+            raise ValueError(f"Unknown optimizer: {optimizer}. Use one of {', '.join(self.OPTIMIZERS)}")
+        
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode: {mode}. Use one of {', '.join(self.MODES)}")
+        
+        if mode == 'fast':
+            if self.surrogate is None:
+                raise ValueError("No surrogate model. Retrain the model to use mode='fast'.")
+            if quantiles:
+                raise ValueError("Quantiles need the per-tree spread; use mode='full'.")
+            if optimizer == 'gp':
+                optimizer = 'analytic'
+        
+        if not products:
+            return []
+        
         # Prepare features
-        features = self.prepare_features(product_data)
-        X_scaled = self.scaler.transform(features.values)
+        with metrics.stage('pricing.prepare_features'):
+            X = self.build_feature_array(products)
+            features = {name: X[:, j] for j, name in enumerate(self.feature_names)}
+            X_scaled = self.scaler.transform(X)
         
-        # Get base prediction from Random Forest
-        base_prediction = self.model.predict(X_scaled)[0]
+        # Base prediction and prediction interval from all trees in one pass
+        if mode == 'fast':
+            with metrics.stage('pricing.surrogate_predict'):
+                forest_output = self.surrogate.predict(X_scaled, features['current_price'])
+        else:
+            forest_output = self.uncertainty.predict(X_scaled, quantiles=quantiles)
+        base_predictions = forest_output['mean']
+        std_predictions = forest_output['std']
         
-        # Get prediction interval from tree predictions
-        tree_predictions = np.array([tree.predict(X_scaled)[0] for tree in self.model.estimators_])
-        std_prediction = np.std(tree_predictions)
+        competitor_avgs = features['competitor_avg_price']
         
         # Apply constraints
-        min_price = product_data['cost_price'] * 1.15  # Minimum 15% margin
-        max_price = product_data['current_price'] * 1.5  # Max 50% increase
-        
-        if use_bayesian:
-            # Use Bayesian Optimization to fine-tune
-            optimal_price = self._bayesian_optimize(
-                product_data,
-                base_prediction,
-                min_price,
-                max_price
-            )
+        min_prices = features['cost_price'] * 1.15  # Minimum 15% margin
+        max_prices = features['current_price'] * 1.5  # Max 50% increase
+        
+        if not use_bayesian:
+            optimal_prices = np.clip(base_predictions, min_prices, max_prices)
+        elif optimizer == 'gp':
+            # Use Bayesian Optimization to fine-tune, one product at a time
+            with metrics.stage('pricing.optimize_gp'):
+                optimal_prices = [
+                    self._bayesian_optimize(product_data, base_predictions[i], min_prices[i], max_prices[i])
+                    for i, product_data in enumerate(products)
+                ]
         else:
-            optimal_price = np.clip(base_prediction, min_price, max_price)
+            # Same objective and bounds, solved for the whole batch at once
+            with metrics.stage(f'pricing.optimize_{optimizer}'):
+                current_prices = features['current_price']
+                demands = features['demand_forecast']
+                elasticities = np.array([p.get('price_elasticity', 1.0) for p in products], dtype=float)
+                optimize = self._grid_optimize if optimizer == 'grid' else self._analytic_optimize
+                optimal_prices = optimize(
+                    current_prices, demands, elasticities, competitor_avgs, min_prices, max_prices
+                )
+        
+        # Expected impact, timed once for the whole batch
+        with metrics.stage('pricing.calculate_impact'):
+            impacts = [
+                self._calculate_impact(product_data, optimal_prices[i])
+                for i, product_data in enumerate(products)
+            ]
+        
+        with metrics.stage('pricing.build_predictions'):
+            results = [
+                self._build_prediction(
+                    product_data,
+                    optimal_prices[i],
+                    std_predictions[i],
+                    competitor_avgs[i],
+                    impacts[i]
+                )
+                for i, product_data in enumerate(products)
+            ]
+        
+        if quantiles:
+            for result, row in zip(results, forest_output['quantiles']):
+                result['price_quantiles'] = {
+                    str(q): round(float(value), 2) for q, value in zip(quantiles, row)
+                }
+        
+        if mode == 'fast':
+            for result in results:
+                result['surrogate'] = self.surrogate_report
+        
+        return results
+    
+    @property
+    def uncertainty(self):
+        """Per-tree prediction engine for the current forest, built on first use"""
+        if self._uncertainty is None:
+            self._uncertainty = ForestUncertainty(self.model)
+        return self._uncertainty
+    
+    def _build_prediction(self, product_data, optimal_price, std_prediction, competitor_avg, impact):
+        """Turn the optimized price and model spread for one product into the response dict"""
+        
+        min_price = product_data['cost_price'] * 1.15
+        max_price = product_data['current_price'] * 1.5
         
         # Calculate confidence based on prediction variance
         confidence = self._calculate_confidence(std_prediction, product_data)
@@ -180,10 +710,7 @@ class SmartPricingModel:
         }
         
         # Generate reasoning
-        reasoning = self._generate_reasoning(product_data, optimal_price, features)
-        
-        # Calculate expected impact
-        impact = self._calculate_impact(product_data, optimal_price)
+        reasoning = self._generate_reasoning(product_data, optimal_price, competitor_avg)
         
         return {
             'suggested_price': round(optimal_price, 2),
@@ -226,16 +753,99 @@ class SmartPricingModel:
             return -(revenue - competitor_penalty)  # Negative because we minimize
         
         # Run optimization
-        result = gp_minimize(
-            objective,
-            space,
-            n_calls=20,
-            random_state=42,
-            noise=0.01
-        )
+        with metrics.stage('pricing.gp_minimize'):
+            result = gp_minimize(
+                objective,
+                space,
+                n_calls=20,
+                random_state=42,
+                noise=0.01
+            )
         
         return result.x[0]
     
+    @staticmethod
+    def _price_objective(prices, current_prices, demands, elasticities, comp_avgs):
+        """
+        Vectorized form of the _bayesian_optimize objective (not negated)
+        
+        All arguments broadcast against each other, e.g. an (N x G) grid of
+        prices with (N x 1) product columns.
+        """
+        price_ratio = prices / current_prices
+        demand_multiplier = (2 - price_ratio) ** elasticities
+        revenue = prices * demands * demand_multiplier
+        competitor_penalty = np.abs(prices - comp_avgs) * 0.1
+        return revenue - competitor_penalty
+    
+    def _grid_optimize(self, current_prices, demands, elasticities, comp_avgs,
+                       min_prices, max_prices, grid_size=256, chunk_size=4096):
+        """Pick the best price on a dense grid, refined once around the coarse optimum"""
+        optimal_prices = np.empty(len(current_prices))
+        steps = np.linspace(0.0, 1.0, grid_size)
+        
+        for start in range(0, len(current_prices), chunk_size):
+            rows = slice(start, start + chunk_size)
+            args = [a[rows, None] for a in (current_prices, demands, elasticities, comp_avgs)]
+            low, high = min_prices[rows, None], max_prices[rows, None]
+            
+            for _ in range(2):
+                grid = low + (high - low) * steps
+                values = self._price_objective(grid, *args)
+                best = np.nanargmax(values, axis=1)
+                best_price = grid[np.arange(len(grid)), best][:, None]
+                
+                # Zoom into the neighbouring grid cells for the second pass
+                spacing = (high - low) / (grid_size - 1)
+                low = np.maximum(low, best_price - spacing)
+                high = np.minimum(high, best_price + spacing)
+            
+            optimal_prices[rows] = best_price[:, 0]
+        
+        return optimal_prices
+    
+    def _analytic_optimize(self, current_prices, demands, elasticities, comp_avgs,
+                           min_prices, max_prices, newton_steps=20, tolerance=1e-6):
+        """
+        Maximize the objective from its stationary points
+        
+        Revenue p * D * (2 - p/c)^e is smooth; the competitor penalty is linear
+        on each side of the competitor average, so the optimum is a bound, the
+        competitor average itself, or a root of R'(p) = +/-0.1 on one side.
+        The roots are found with vectorized Newton steps starting from the
+        unpenalized optimum 2c / (1 + e), solving both sides at once and
+        stopping once no price moves by more than tolerance * c (a handful of
+        steps; newton_steps is the cap).
+        """
+        c, D, e, a = current_prices, demands, elasticities, comp_avgs
+        low, high = min_prices, max_prices
+        competitor = np.clip(a, low, high)
+        
+        # Column 0: priced above competitors, column 1: priced below
+        side = np.array([1.0, -1.0])
+        branch_low = np.stack([competitor, low], axis=1)
+        branch_high = np.stack([high, competitor], axis=1)
+        c2, D2, e2 = c[:, None], D[:, None], e[:, None]
+        p = np.clip(np.clip(2 * c / (1 + e), low, high)[:, None], branch_low, branch_high)
+        
+        for _ in range(newton_steps):
+            u = 2 - p / c2
+            u_e2 = u ** (e2 - 2)
+            v = u - e2 * p / c2
+            slope = D2 * u_e2 * u * v - 0.1 * side
+            curvature = -(D2 / c2) * u_e2 * ((e2 - 1) * v + (1 + e2) * u)
+            step = np.divide(slope, curvature, out=np.zeros_like(p), where=curvature < 0)
+            p_next = np.clip(p - step, branch_low, branch_high)
+            converged = not np.any(np.abs(p_next - p) > tolerance * c2)
+            p = p_next
+            if converged:
+                break
+        
+        candidates = np.concatenate([np.stack([low, high, competitor], axis=1), p], axis=1)
+        values = self._price_objective(candidates, c2, D2, e2, a[:, None])
+        best = np.nanargmax(values, axis=1)
+        return candidates[np.arange(len(candidates)), best]
+    
     def _calculate_confidence(self, std_prediction, product_data):
         """Calculate confidence score based on prediction variance and data quality"""
         
@@ -254,7 +864,7 @@ class SmartPricingModel:
         
         return confidence
     
-    def _generate_reasoning(self, product_data, suggested_price, features):
+    def _generate_reasoning(self, product_data, suggested_price, comp_avg):
         """Generate human-readable reasoning for the price suggestion"""
         
         current = product_data['current_price']
@@ -263,7 +873,6 @@ class SmartPricingModel:
         reasons = []
         
         # Price vs competitors
-        comp_avg = features['competitor_avg_price'].values[0]
         if suggested_price < comp_avg * 0.95:
             reasons.append("Competitive pricing advantage")
         elif suggested_price > comp_avg * 1.05:
@@ -324,63 +933,111 @@ class SmartPricingModel:
     
     def save_model(self, filepath='pricing_model.pkl'):
         """Save trained model and scaler"""
-        joblib.dump({
+        save_artifact({
             'model': self.model,
             'scaler': self.scaler,
-            'feature_names': self.feature_names
+            'feature_names': self.feature_names,
+            'model_version': self.model_version,
+            'surrogate': self.surrogate,
+            'surrogate_report': self.surrogate_report,
+            'training_sample': self.training_sample
         }, filepath)
         return {'status': 'success', 'filepath': filepath}
     
     def load_model(self, filepath='pricing_model.pkl'):
-        """Load trained model and scaler"""
-        data = joblib.load(filepath)
+        """Load trained model and scaler (once per process, arrays memory-mapped)"""
+        data = load_artifact(filepath)
         self.model = data['model']
+        self._uncertainty = None
         self.scaler = data['scaler']
         self.feature_names = data['feature_names']
+        # Models saved before the surrogate was added only support mode='full'
+        self.surrogate = data.get('surrogate')
+        self.surrogate_report = data.get('surrogate_report')
+        self.training_sample = data.get('training_sample')
+        # Models saved before versioning was added are versioned by file mtime
+        self.model_version = data.get('model_version') or str(os.path.getmtime(filepath))
         return {'status': 'success', 'filepath': filepath}
 
 
 # Example usage and training data generation
-def generate_synthetic_training_data(n_samples=1000):
-    """Generate synthetic training data for initial model training"""
-    np.random.seed(42)
-    
-    training_data = []
-    
-    for _ in range(n_samples):
-        cost = np.random.uniform(100, 5000)
-        base_price = cost * np.random.uniform(1.3, 2.5)
-        
-        # Simulate optimal price based on various factors
-        demand = np.random.uniform(50, 500)
-        comp_prices = base_price * np.random.uniform(0.8, 1.2, size=3)
-        stock = np.random.randint(10, 500)
-        
-        # Optimal price logic
-        if demand > 300 and stock < 100:
-            optimal = base_price * 1.15  # High demand, low stock = increase
-        elif demand < 100 and stock > 300:
-            optimal = base_price * 0.85  # Low demand, high stock = decrease
-        elif np.mean(comp_prices) < base_price * 0.9:
-            optimal = np.mean(comp_prices) * 1.05  # Match competition
-        else:
-            optimal = base_price * np.random.uniform(0.95, 1.1)
-        
-        training_data.append({
-            'current_price': base_price,
-            'cost_price': cost,
-            'demand_forecast': demand,
-            'competitor_prices': comp_prices.tolist(),
-            'stock_level': stock,
-            'days_in_stock': np.random.randint(1, 90),
-            'seasonality_index': np.random.uniform(0.8, 1.2),
-            'category_avg_price': base_price * np.random.uniform(0.9, 1.1),
-            'historical_sales': np.random.uniform(50, 200, size=30).tolist(),
-            'optimal_price': optimal,
-            'revenue_generated': optimal * demand
-        })
-    
-    return training_data
+SYNTHETIC_FIELDS = [
+    'current_price', 'cost_price', 'demand_forecast', 'competitor_prices', 'stock_level',
+    'days_in_stock', 'seasonality_index', 'category_avg_price', 'historical_sales',
+    'optimal_price', 'revenue_generated'
+]
+
+
+def _synthetic_columns(rng, n_samples, n_competitors=3, history_days=30):
+    """Draw n_samples synthetic rows from rng, one array per field"""
+    cost = rng.uniform(100, 5000, n_samples)
+    base_price = cost * rng.uniform(1.3, 2.5, n_samples)
+    
+    # Simulate optimal price based on various factors
+    demand = rng.uniform(50, 500, n_samples)
+    comp_prices = base_price[:, None] * rng.uniform(0.8, 1.2, (n_samples, n_competitors))
+    stock = rng.integers(10, 500, n_samples)
+    comp_avg = comp_prices.mean(axis=1)
+    
+    # Optimal price logic, first matching rule wins
+    optimal = np.select(
+        [
+            (demand > 300) & (stock < 100),   # High demand, low stock = increase
+            (demand < 100) & (stock > 300),   # Low demand, high stock = decrease
+            comp_avg < base_price * 0.9       # Match competition
+        ],
+        [base_price * 1.15, base_price * 0.85, comp_avg * 1.05],
+        default=base_price * rng.uniform(0.95, 1.1, n_samples)
+    )
+    
+    return {
+        'current_price': base_price,
+        'cost_price': cost,
+        'demand_forecast': demand,
+        'competitor_prices': comp_prices,
+        'stock_level': stock,
+        'days_in_stock': rng.integers(1, 90, n_samples),
+        'seasonality_index': rng.uniform(0.8, 1.2, n_samples),
+        'category_avg_price': base_price * rng.uniform(0.9, 1.1, n_samples),
+        'historical_sales': rng.uniform(50, 200, (n_samples, history_days)),
+        'optimal_price': optimal,
+        'revenue_generated': optimal * demand
+    }
+
+
+def generate_synthetic_training_columns(n_samples=1000, seed=42):
+    """
+    Synthetic training data as columns (see build_columnar_feature_array)
+    
+    Every field is drawn for all rows at once: (N,) arrays for the scalar
+    fields, competitor_prices as (N x 3) and historical_sales as (N x 30).
+    """
+    return _synthetic_columns(np.random.default_rng(seed), n_samples)
+
+
+def iter_synthetic_training_columns(n_samples, chunk_size=100000, seed=42):
+    """
+    Stream the synthetic training set as columnar chunks of at most chunk_size rows
+    
+    Only one chunk is in memory at a time, so millions of rows can be
+    generated for load testing. The rows depend on seed and chunk_size.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_samples, chunk_size):
+        yield _synthetic_columns(rng, min(chunk_size, n_samples - start))
+
+
+def generate_synthetic_training_data(n_samples=1000, seed=42):
+    """
+    Generate synthetic training data for initial model training (list of dicts)
+    
+    Same rows as generate_synthetic_training_columns(n_samples, seed). These
+    come from default_rng, not the legacy np.random.seed(42) stream, so a
+    seed gives different rows than the old row-by-row generator did.
+    """
+    columns = generate_synthetic_training_columns(n_samples, seed)
+    values = [columns[name].tolist() for name in SYNTHETIC_FIELDS]
+    return [dict(zip(SYNTHETIC_FIELDS, row)) for row in zip(*values)]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# backend/ml_models/serve.py
+#
+# Production server for the demand API: a pre-forked pool of worker processes
+# sharing one listening socket, each serving requests on a bounded thread pool.
+# The models are loaded once before forking, so their memory-mapped arrays are
+# shared between workers, and XGBoost is pinned to cores // workers threads per
+# worker so concurrent predictions do not oversubscribe the CPU. Dead workers
+# are restarted; SIGTERM/SIGINT stops them all.
+#
+# Usage:
+#   python serve.py                                   # one worker per core
+#   python serve.py --workers 4 --threads 8 --port 5001
+#
+# Every option can also be set through the environment (DEMAND_WORKERS,
+# DEMAND_THREADS, DEMAND_NTHREAD, DEMAND_HOST, DEMAND_PORT, ML_METRICS_DIR).
+#
+# The workers write their metrics to one directory (a temporary one unless
+# --metrics-dir is given), so /metrics reports the whole server, whichever
+# worker answers the scrape.
+
+import os
+import sys
+import time
+import glob
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+from stage_metrics import metrics
+
+# Seconds between the metrics snapshots each worker writes for /metrics
+METRICS_WRITE_INTERVAL = 5.0
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Werkzeug server that handles requests on a fixed-size thread pool
+
+    A worker takes a free thread before it calls accept(), so while it is
+    busy the connections queue on the shared socket and go to whichever
+    worker accepts first. The socket is non-blocking: the workers that lose
+    that race get EAGAIN instead of waiting in accept() for the next one.
+    """
+
+    def __init__(self, host, port, app, fd, threads):
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        super().__init__(host, port, app, fd=fd)
+        self.socket.setblocking(False)
+
+    def _handle_request_noblock(self):
+        self._slots.acquire()
+        try:
+            request, client_address = self.get_request()
+        except OSError:
+            self._slots.release()
+            return
+        # Some platforms pass the listening socket's O_NONBLOCK on to accepted ones
+        request.setblocking(True)
+        if not self.verify_request(request, client_address):
+            self.shutdown_request(request)
+            self._slots.release()
+            return
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        """Wait for the requests in flight to finish"""
+        self._pool.shutdown(wait=True)
+
+
+def parse_args():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Multi-process server for the demand API")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("DEMAND_WORKERS", cores)),
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("DEMAND_THREADS", 4)),
+                        help="request threads per worker (default: 4)")
+    parser.add_argument("--nthread", type=int, default=os.environ.get("DEMAND_NTHREAD"),
+                        help="XGBoost threads per worker (default: cores // workers)")
+    parser.add_argument("--host", default=os.environ.get("DEMAND_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("DEMAND_PORT", 5001)))
+    parser.add_argument("--metrics-dir", default=os.environ.get("ML_METRICS_DIR"),
+                        help="directory the workers share their metrics through (default: a temporary one)")
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+    args.threads = max(1, args.threads)
+    args.nthread = max(1, int(args.nthread) if args.nthread is not None else cores // args.workers)
+    return args, cores
+
+
+def run_worker(app, sock, args):
+    """Serve on the inherited socket until SIGTERM; never returns"""
+    status = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        # The parent's metrics were copied by the fork and are already shared
+        metrics.reset()
+        metrics.share(args.metrics_dir, interval=METRICS_WRITE_INTERVAL)
+        server = PooledWSGIServer(args.host, args.port, app, sock.fileno(), args.threads)
+        try:
+            server.serve_forever()
+        finally:
+            server.drain()
+            server.server_close()
+    except SystemExit:
+        pass
+    except BaseException as e:
+        print(f"Worker {os.getpid()} failed:", e)
+        status = 1
+    finally:
+        # Never fall back into the supervisor loop of the parent
+        os._exit(status)
+
+
+def main():
+    args, cores = parse_args()
+
+    # OpenMP reads this once, when XGBoost is first imported
+    training_threads = os.environ.get("OMP_NUM_THREADS", str(cores))
+    os.environ["OMP_NUM_THREADS"] = str(args.nthread)
+
+    # Imported here, not at module level: the training pool spawns processes
+    # that re-import this file
+    import api
+    api.PREDICT_THREADS = args.nthread
+    # Training runs in its own processes and gets the whole machine back
+    api.training_jobs.worker_env = {"OMP_NUM_THREADS": training_threads}
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    # Metrics of an earlier run would add up with this one's
+    created_metrics_dir = args.metrics_dir is None
+    if created_metrics_dir:
+        args.metrics_dir = tempfile.mkdtemp(prefix="ml-metrics-")
+    else:
+        os.makedirs(args.metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(args.metrics_dir, "*.json")):
+            os.remove(path)
+
+    # Load the models before forking so the workers share their pages.
+    # Nothing is predicted here: OpenMP threads do not survive a fork
+    for registry in (api.demand_models, api.global_demand_models):
+        if registry.snapshot() is None:
+            print("Demand models not loaded yet; workers will pick them up once trained.")
+    # Model loads so far are counted once, by the parent
+    metrics.share(args.metrics_dir)
+
+    print(f"Serving demand API on {args.host}:{args.port} with {args.workers} workers x "
+          f"{args.threads} threads, {args.nthread} XGBoost threads per worker")
+
+    workers = {}
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(api.app, sock, args)
+        workers[pid] = slot
+        print(f"Worker {slot} started (pid {pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(args.workers):
+        spawn(slot)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = workers.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        print(f"Worker {slot} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+        time.sleep(1)
+        spawn(slot)
+
+    sock.close()
+    if created_metrics_dir:
+        shutil.rmtree(args.metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# backend/ml_models/stage_metrics.py
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class StageMetrics:
+    """
+    Per-stage latency histograms and event counters for this process.
+
+    Code wraps each stage in `with metrics.stage("name"):`. The time goes
+    into a histogram per stage (exposed in the Prometheus text format by
+    render()) and, inside `with metrics.collect() as timings:`, into a
+    per-request {stage: {seconds, calls}} dict on the current thread.
+    When disabled and no request is collecting, stage() returns a shared
+    no-op context manager and nothing is timed.
+
+    Processes that serve the same endpoint (serve.py workers) call share()
+    with one directory; render() then adds up all of their metrics.
+    """
+
+    def __init__(self, enabled=True, buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.directory = None
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stage(self, name):
+        if not self.enabled and getattr(self._local, 'timings', None) is None:
+            return _NO_STAGE
+        return _Stage(self, name)
+
+    def observe(self, name, seconds):
+        """Record one run of a stage"""
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None:
+            entry = timings.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += seconds
+            entry['calls'] += 1
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                histogram['buckets'][index] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def count(self, name, value=1, **labels):
+        """Add to a counter, e.g. count('ml_model_loads_total', artifact='x.pkl')"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        """Set a gauge, e.g. gauge('ml_forecast_cache_entries', 120)"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def reset(self):
+        """Forget everything recorded so far, e.g. in a forked child"""
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+            self._gauges = {}
+
+    def share(self, directory, interval=None):
+        """
+        Add this process's metrics to the ones rendered by every process sharing directory
+
+        The metrics are written to <directory>/<pid>.json now, on every
+        render() and, given an interval, every interval seconds from a
+        daemon thread, so the other processes' numbers are at most that old.
+        Files of processes that exited still count towards the histograms
+        and counters, so their totals never go down when a worker restarts;
+        gauges only count for live processes.
+        """
+        self.directory = directory
+        self.write()
+        if interval:
+            def write_every():
+                while True:
+                    time.sleep(interval)
+                    self.write()
+            threading.Thread(target=write_every, name='metrics-writer', daemon=True).start()
+
+    def write(self):
+        """Write this process's metrics to the shared directory"""
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'histograms': {name: [list(h['buckets']), h['sum'], h['count']] for name, h in self._histograms.items()},
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self._gauges.items()]
+            }
+
+    def _shared_snapshots(self):
+        """(pid, snapshot) of every process sharing the directory, this one freshly written"""
+        self.write()
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != '.json' or not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshots.append((int(pid), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _merged(self):
+        """Histograms, counters and gauges of this process, or of all sharing processes"""
+        if self.directory is None:
+            snapshots = [(os.getpid(), self._snapshot())]
+        else:
+            snapshots = self._shared_snapshots()
+
+        histograms, counters, gauges = {}, {}, {}
+        for pid, snapshot in snapshots:
+            for name, (buckets, total, count) in snapshot['histograms'].items():
+                merged = histograms.setdefault(name, [[0] * len(self.buckets), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            if pid == os.getpid() or self._is_alive(pid):
+                for name, labels, value in snapshot['gauges']:
+                    key = (name, tuple(tuple(label) for label in labels))
+                    gauges[key] = gauges.get(key, 0) + value
+        return histograms, counters, gauges
+
+    @contextmanager
+    def collect(self, enabled=True):
+        """
+        Collect the stage timings of the current thread.
+
+        Yields the {stage: {seconds, calls}} dict, filled in as stages
+        finish, or None when enabled is False.
+        """
+        if not enabled:
+            yield None
+            return
+        previous = getattr(self._local, 'timings', None)
+        timings = self._local.timings = {}
+        try:
+            yield timings
+        finally:
+            self._local.timings = previous
+            for entry in timings.values():
+                entry['seconds'] = round(entry['seconds'], 6)
+
+    def render(self, prefix='ml'):
+        """All histograms, counters and gauges in the Prometheus text exposition format"""
+        histograms, counters, gauges = self._merged()
+
+        lines = [
+            f'# HELP {prefix}_stage_seconds Time spent in each pricing/forecasting stage.',
+            f'# TYPE {prefix}_stage_seconds histogram'
+        ]
+        for name in sorted(histograms):
+            buckets, total, count = histograms[name]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {count}')
+
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            typed = set()
+            for (name, labels) in sorted(values):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} {kind}')
+                    typed.add(name)
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+                lines.append(f'{name}{{{label_text}}} {values[(name, labels)]}' if label_text
+                             else f'{name} {values[(name, labels)]}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every module of this process; ML_METRICS=0 turns the histograms
+# and counters off (per-request timings still work when asked for)
+metrics = StageMetrics(enabled=os.environ.get('ML_METRICS', '1') != '0')
@@ -0,0 +1,69 @@
+# backend/ml_models/test_feature_store.py
+#
+# Run from backend/ml_models: python -m pytest -q test_feature_store.py
+import numpy as np
+import pandas as pd
+import api
+from feature_store import FeatureStore
+
+
+def sales_history(days=120, seed=1):
+    """Weekly pattern plus noise, one row per day"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=days, freq="D")
+    return pd.DataFrame({
+        "date": dates,
+        "quantity_sold": 50 + 10 * (dates.dayofweek >= 5) + rng.normal(0, 3, days).round(2)
+    })
+
+
+def new_store(tmp_path, name="features.sqlite"):
+    return FeatureStore(str(tmp_path / name), capacity=api.HISTORY_CAPACITY, ewm_span=api.EWM_SPAN)
+
+
+def assert_matches_full_rebuild(states, series):
+    store = api._store_context(states)
+    full = api._series_context(series)
+    assert store["product_ids"] == full["product_ids"]
+    assert list(store["last_dates"]) == list(full["last_dates"])
+    np.testing.assert_array_equal(store["history_lengths"], full["history_lengths"])
+    np.testing.assert_allclose(store["tails"], np.array(full["tails"]), rtol=1e-12)
+    np.testing.assert_allclose(store["ewm"], full["ewm"], rtol=1e-9)
+    np.testing.assert_allclose(store["ewm_weight"], full["ewm_weight"], rtol=1e-9)
+    np.testing.assert_allclose(store["anchors"], full["anchors"], rtol=1e-9)
+    X_store = store["X_last"][full["features"]].to_numpy(dtype=np.float64)
+    np.testing.assert_allclose(X_store, full["X_last"].to_numpy(dtype=np.float64), rtol=1e-9)
+
+
+def test_appended_days_match_full_rebuild(tmp_path):
+    store = new_store(tmp_path)
+    df = sales_history()
+
+    store.sync({"p1": df.iloc[:90]})
+    states = store.sync({"p1": df})
+
+    assert states["p1"]["count"] == len(df)
+    assert_matches_full_rebuild(states, {"p1": df})
+
+
+def test_edit_within_window_rebuilds(tmp_path):
+    store = new_store(tmp_path)
+    df = sales_history()
+    store.sync({"p1": df})
+
+    edited = df.copy()
+    edited.loc[len(df) - 5, "quantity_sold"] += 7
+    assert_matches_full_rebuild(store.sync({"p1": edited}), {"p1": edited})
+
+
+def test_invalidate_rebuilds_older_edit(tmp_path):
+    store = new_store(tmp_path)
+    df = sales_history()
+    store.sync({"p1": df, "p2": sales_history(seed=2)})
+
+    # Outside the lag/rolling windows: only seen after invalidate()
+    edited = df.copy()
+    edited.loc[5, "quantity_sold"] += 7
+    assert store.invalidate(["p1"]) == 1
+    assert_matches_full_rebuild(store.sync({"p1": edited}), {"p1": edited})
+    assert set(store.get_many(["p1", "p2"])) == {"p1", "p2"}
@@ -0,0 +1,53 @@
+# backend/ml_models/test_forecast_cache.py
+#
+# Run from backend/ml_models: python -m pytest -q test_forecast_cache.py
+import numpy as np
+import pandas as pd
+import api
+from forecast_cache import ForecastCache
+
+
+def zero_history(days=60):
+    """A new or slow-moving SKU: every day without sales"""
+    return pd.DataFrame({
+        "date": pd.date_range("2024-01-01", periods=days, freq="D"),
+        "quantity_sold": np.zeros(days)
+    })
+
+
+def test_key_depends_on_product_id():
+    df = zero_history()
+    assert ForecastCache.key("global", "v1", 7, "p1", df, "toys") != ForecastCache.key("global", "v1", 7, "p2", df, "toys")
+    assert ForecastCache.key("global", "v1", 7, "p1", df, "toys") == ForecastCache.key("global", "v1", 7, "p1", df.copy(), "toys")
+
+
+def test_same_history_products_get_separate_entries(monkeypatch):
+    monkeypatch.setattr(api, "forecast_cache", ForecastCache())
+    calls = []
+
+    # The global model's output differs per product (product_code feature)
+    def forecast_ensemble_batch(snapshot, series, days_to_forecast, categories=None, use_feature_store=False):
+        calls.append(list(series))
+        product_ids = list(series)
+        return {
+            "product_ids": product_ids,
+            "last_dates": pd.DatetimeIndex([df["date"].iloc[-1] for df in series.values()]),
+            "predicted": np.array([[float(i + 1)] * days_to_forecast for i, _ in enumerate(product_ids)])
+        }
+
+    monkeypatch.setattr(api, "forecast_ensemble_batch", forecast_ensemble_batch)
+    snapshot = {"version": "v1", "models": {"encoders": {}}}
+    categories = {"p1": "toys", "p2": "toys"}
+
+    first = api.forecast_ensemble_cached(snapshot, {"p1": zero_history()}, 7, categories)
+    second = api.forecast_ensemble_cached(snapshot, {"p2": zero_history()}, 7, categories)
+
+    assert calls == [["p1"], ["p2"]]
+    assert api.forecast_cache.stats()["entries"] == 2
+    assert first["predicted"][0, 0] == 1.0 and second["predicted"][0, 0] == 1.0
+
+    # Both now come from their own cache entries
+    both = api.forecast_ensemble_cached(snapshot, {"p1": zero_history(), "p2": zero_history()}, 7, categories)
+    assert calls == [["p1"], ["p2"]]
+    assert api.forecast_cache.stats()["hits"] == 2
+    assert both["product_ids"] == ["p1", "p2"]
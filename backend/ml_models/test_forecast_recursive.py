@@ -0,0 +1,79 @@
+# backend/ml_models/test_forecast_recursive.py
+#
+# Run from backend/ml_models: python -m pytest -q test_forecast_recursive.py
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import api
+
+
+class RecordingModel:
+    """Stands in for the XGBoost model: records every feature row, predicts a fixed deviation"""
+
+    def __init__(self, deviation=1.5):
+        self.deviation = deviation
+        self.rows = []
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.rows.extend(X.copy())
+        return np.full(len(X), self.deviation)
+
+
+def sales_history(days=90, seed=3):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=days, freq="D")
+    return pd.DataFrame({
+        "date": dates,
+        "quantity_sold": 50 + 10 * (dates.dayofweek >= 5) + rng.normal(0, 3, days)
+    })
+
+
+def pandas_recursive(df, model, days_to_forecast):
+    """The per-step pandas loop the ring buffer replaced (concat, full EWM each step)"""
+    processed = api.create_features(df)
+    features = api._feature_columns(processed)
+    anchors = processed.groupby("day_of_week")["seasonal_avg"].first()
+    global_anchor = processed["seasonal_avg"].mean()
+    forecast_df = df.copy()
+    last_date = forecast_df["date"].max()
+    predictions = []
+
+    for i in range(1, days_to_forecast + 1):
+        next_date = last_date + timedelta(days=i)
+        quantities = forecast_df["quantity_sold"]
+        row = {
+            "month": next_date.month,
+            "day_of_week": next_date.dayofweek,
+            "day_of_year": next_date.dayofyear,
+            "is_weekend": int(next_date.dayofweek >= 5),
+            "sin_dayofyear": np.sin(2 * np.pi * next_date.dayofyear / 365),
+            "cos_dayofyear": np.cos(2 * np.pi * next_date.dayofyear / 365),
+            "time_index": len(forecast_df) + i
+        }
+        for lag in api.LAGS:
+            row[f"lag_{lag}"] = quantities.iloc[-lag]
+        for window in api.ROLLING_WINDOWS:
+            row[f"rolling_mean_{window}"] = quantities.iloc[-window:].mean()
+            row[f"rolling_std_{window}"] = quantities.iloc[-window:].std()
+        row[f"ewm_mean_{api.EWM_SPAN}"] = quantities.ewm(span=api.EWM_SPAN).mean().iloc[-1]
+
+        deviation = model.predict(pd.DataFrame([row])[features])[0]
+        prediction = max(0, anchors.get(next_date.dayofweek, global_anchor) + deviation)
+        predictions.append(prediction)
+        forecast_df = pd.concat([forecast_df, pd.DataFrame([{"date": next_date, "quantity_sold": prediction}])],
+                                ignore_index=True)
+
+    return np.array(predictions)
+
+
+def test_ring_buffer_matches_pandas_features():
+    df = sales_history()
+    ring_model, pandas_model = RecordingModel(), RecordingModel()
+
+    predicted = api.forecast_recursive(df, ring_model, 30)
+    expected = pandas_recursive(df, pandas_model, 30)
+
+    np.testing.assert_allclose(predicted, expected, rtol=1e-9)
+    assert len(ring_model.rows) == len(pandas_model.rows) == 30
+    np.testing.assert_allclose(np.array(ring_model.rows), np.array(pandas_model.rows), rtol=1e-9)
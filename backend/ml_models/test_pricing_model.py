@@ -0,0 +1,35 @@
+# backend/ml_models/test_pricing_model.py
+#
+# Run from backend/ml_models: python -m pytest -q test_pricing_model.py
+import numpy as np
+from pricing_model import SmartPricingModel
+
+PRODUCTS = [
+    {"current_price": 100.0, "cost_price": 60.0, "demand_forecast": 30.0, "price_elasticity": 1.0, "competitor_prices": [95.0, 110.0]},
+    {"current_price": 250.0, "cost_price": 120.0, "demand_forecast": 8.0, "price_elasticity": 1.8, "competitor_prices": [240.0]},
+    {"current_price": 40.0, "cost_price": 30.0, "demand_forecast": 150.0, "price_elasticity": 0.6, "competitor_prices": [55.0, 48.0, 60.0]}
+]
+
+
+def test_vectorized_optimizers_reach_gp_objective():
+    model = SmartPricingModel()
+    current_prices = np.array([p["current_price"] for p in PRODUCTS])
+    demands = np.array([p["demand_forecast"] for p in PRODUCTS])
+    elasticities = np.array([p["price_elasticity"] for p in PRODUCTS])
+    comp_avgs = np.array([np.mean(p["competitor_prices"]) for p in PRODUCTS])
+    min_prices = np.array([p["cost_price"] for p in PRODUCTS]) * 1.15
+    max_prices = current_prices * 1.5
+    args = (current_prices, demands, elasticities, comp_avgs, min_prices, max_prices)
+
+    def objective(prices):
+        return SmartPricingModel._price_objective(np.asarray(prices), current_prices, demands, elasticities, comp_avgs)
+
+    gp_prices = [
+        model._bayesian_optimize(product, product["current_price"], min_prices[i], max_prices[i])
+        for i, product in enumerate(PRODUCTS)
+    ]
+    tolerance = 1e-6 * np.abs(objective(gp_prices))
+
+    for prices in (model._grid_optimize(*args), model._analytic_optimize(*args)):
+        assert np.all((prices >= min_prices) & (prices <= max_prices))
+        assert np.all(objective(prices) >= objective(gp_prices) - tolerance)
@@ -0,0 +1,186 @@
+# backend/ml_models/train_jobs.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Set in worker processes: where jobs report their stage
+_progress_queue = None
+
+ACTIVE_STATUSES = ("queued", "running", "publishing")
+
+
+def _init_worker(queue, env):
+    global _progress_queue
+    _progress_queue = queue
+    # Before the job function's module (and XGBoost/OpenMP) is imported
+    os.environ.update(env)
+
+
+def report_progress(job_id, stage):
+    """Report a job's current stage; a no-op outside a worker process"""
+    if _progress_queue is not None and job_id is not None:
+        _progress_queue.put((job_id, stage, time.time()))
+
+
+def _run_job(job_id, fn, args):
+    report_progress(job_id, "running")
+    return fn(job_id, *args)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TrainingJobs:
+    """
+    Background training jobs on a process pool, at most one per model.
+
+    A job function runs in a worker process as fn(job_id, *args), calls
+    report_progress(job_id, stage) as it goes, and returns a payload. Back in
+    the submitting process the job's publish(payload) callback installs the
+    artifacts and returns the result stored on the job. Training never
+    blocks the web server, and nothing is published unless the whole job
+    succeeded.
+
+    Job records live in SQLite, so with several server processes any of
+    them can report on any job, and the one-job-per-model rule holds across
+    all of them. A job whose owning process died is marked failed.
+    """
+
+    def __init__(self, path, max_workers=2):
+        self.path = path
+        self.max_workers = max_workers
+        # Extra environment for the training processes, e.g. to undo the
+        # thread pinning of the serving processes
+        self.worker_env = {}
+        self._lock = threading.Lock()
+        self._created = False
+        self._executor = None
+        self._queue = None
+
+    def _connect(self):
+        """Connection to the job table; created on first use"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._created:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS training_jobs ("
+                    "id TEXT PRIMARY KEY, model TEXT NOT NULL, status TEXT NOT NULL, "
+                    "stage TEXT NOT NULL, stages TEXT NOT NULL, owner_pid INTEGER NOT NULL, "
+                    "submitted_at REAL NOT NULL, finished_at REAL, result TEXT, error TEXT)"
+                )
+                conn.execute(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS one_active_job_per_model ON training_jobs (model) "
+                    f"WHERE status IN ({', '.join(repr(s) for s in ACTIVE_STATUSES)})"
+                )
+            self._created = True
+        return conn
+
+    def _ensure_executor(self):
+        # Started on first use; spawn keeps the XGBoost/Flask threads of this
+        # process out of the workers
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            self._queue = context.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=context,
+                initializer=_init_worker, initargs=(self._queue, dict(self.worker_env))
+            )
+            threading.Thread(target=self._drain_progress, daemon=True).start()
+
+    def _drain_progress(self):
+        while True:
+            job_id, stage, at = self._queue.get()
+            self._set_stage(job_id, stage, at, statuses=("queued", "running"), status="running")
+
+    def _set_stage(self, job_id, stage, at, statuses=ACTIVE_STATUSES, **fields):
+        """Move an active job to stage; only the submitting process writes a job"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT status, stages FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] not in statuses:
+                return
+            fields["stage"] = stage
+            fields["stages"] = json.dumps(json.loads(row["stages"]) + [{"stage": stage, "at": at}])
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            conn.execute(f"UPDATE training_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _fail_orphans(self, conn, model=None):
+        """Mark active jobs whose owning process is gone as failed"""
+        query = f"SELECT id, owner_pid FROM training_jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})"
+        params = list(ACTIVE_STATUSES)
+        if model is not None:
+            query += " AND model = ?"
+            params.append(model)
+        for row in conn.execute(query, params).fetchall():
+            if not _pid_alive(row["owner_pid"]):
+                conn.execute(
+                    "UPDATE training_jobs SET status = 'failed', stage = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                    (f"Server process {row['owner_pid']} exited before the job finished.", time.time(), row["id"])
+                )
+
+    def submit(self, model, fn, args, publish):
+        """
+        Queue a training job for model.
+
+        Returns (job, True), or (the active job, False) if model already has
+        a job queued, running or publishing in any server process.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            self._fail_orphans(conn, model)
+            try:
+                conn.execute(
+                    "INSERT INTO training_jobs (id, model, status, stage, stages, owner_pid, submitted_at) "
+                    "VALUES (?, ?, 'queued', 'queued', ?, ?, ?)",
+                    (job_id, model, json.dumps([{"stage": "queued", "at": now}]), os.getpid(), now)
+                )
+            except sqlite3.IntegrityError:
+                row = conn.execute(
+                    f"SELECT * FROM training_jobs WHERE model = ? AND status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+                    (model, *ACTIVE_STATUSES)
+                ).fetchone()
+                return self._view(row), False
+
+        self._ensure_executor()
+        future = self._executor.submit(_run_job, job_id, fn, args)
+        future.add_done_callback(lambda f: self._finish(job_id, f, publish))
+        return self.get(job_id), True
+
+    def _finish(self, job_id, future, publish):
+        try:
+            self._set_stage(job_id, "publishing", time.time(), status="publishing")
+            result = publish(future.result())
+            self._set_stage(job_id, "done", time.time(), status="done",
+                            result=json.dumps(result), finished_at=time.time())
+        except Exception as e:
+            print(f"Training job {job_id} failed:", e)
+            self._set_stage(job_id, "failed", time.time(), status="failed",
+                            error=str(e), finished_at=time.time())
+
+    def _view(self, row):
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        end = job["finished_at"] or time.time()
+        job["elapsed_seconds"] = round(end - job["submitted_at"], 2)
+        return job
+
+    def get(self, job_id):
+        """A job's status, stage, elapsed time and result, or None"""
+        with self._lock, self._connect() as conn:
+            self._fail_orphans(conn)
+            row = conn.execute("SELECT * FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._view(row) if row is not None else None
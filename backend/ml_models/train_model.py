@@ -1,79 +1,226 @@
 #!/usr/bin/env python3
 # backend/ml_models/train_model.py
+#
+# Usage:
+#   python train_model.py                  # JSON {"training_data": [...]} on stdin
+#   python train_model.py data.npz         # columnar arrays, see load_columnar()
+#   python train_model.py --incremental data.npz
+#   python train_model.py --distill        # or JSON {"distill": true} on stdin
+#
+# The JSON input may set "mode": "full" (default) | "incremental". Incremental
+# training refreshes the saved pricing_model.pkl with the given (recent) data
+# instead of rebuilding it; see SmartPricingModel.fit_incremental.
+#
+# Training does not distill the surrogate used by fast predictions; the
+# distill step does, on the saved model, and is meant to run after training
+# when the response says "needs_distill", off the request path. Until then
+# fast requests are answered by the forest (full training) or by the kept
+# surrogate (incremental training).
 
 import sys
 import json
 import os
+import numpy as np
 from pricing_model import SmartPricingModel
+from model_store import load_artifact
 
-def main():
-    try:
-        # Read input from stdin
-        input_data = sys.stdin.read()
-        
-        if not input_data:
-            raise ValueError("No input data received")
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'pricing_model.pkl')
+TRAINING_MODES = ('full', 'incremental')
+REQUIRED_FIELDS = ['current_price', 'cost_price', 'demand_forecast', 'optimal_price']
+OPTIONAL_FIELDS = ['stock_level', 'days_in_stock', 'seasonality_index', 'category_avg_price', 'revenue_generated']
+
+
+def load_columnar(filepath):
+    """
+    Load and clean a columnar training set from an .npz file
+    
+    Expected arrays (N rows):
+        current_price, cost_price, demand_forecast, optimal_price   (N,)    required
+        stock_level, days_in_stock, seasonality_index,
+        category_avg_price, revenue_generated                       (N,)    optional, NaN = default
+        competitor_prices                                           (N, k)  optional, NaN-padded
+        historical_sales                                            (N, h)  optional, NaN-padded
+    
+    Cleaning is vectorized: rows missing a required value are dropped and
+    defaults are filled per column, matching the JSON path.
+    
+    Returns (columns, n_total) where n_total counts rows before cleaning.
+    """
+    with np.load(filepath) as data:
+        for field in REQUIRED_FIELDS:
+            if field not in data.files:
+                raise ValueError(f"Missing required array: {field}")
         
-        # Parse JSON input
-        data = json.loads(input_data)
+        n_total = len(data['current_price'])
         
-        if 'training_data' not in data or not data['training_data']:
-            raise ValueError("No training data provided")
+        def column(name):
+            if name not in data.files:
+                return np.full(n_total, np.nan)
+            return np.asarray(data[name], dtype=np.float64).reshape(n_total)
         
-        training_data = data['training_data']
+        def matrix(name):
+            if name not in data.files:
+                return np.empty((n_total, 0))
+            return np.asarray(data[name], dtype=np.float64).reshape(n_total, -1)
         
-        # Validate and clean training data
-        cleaned_data = []
-        for item in training_data:
-            try:
-                # Ensure all required fields exist and are not None
-                if all(key in item and item[key] is not None for key in [
-                    'current_price', 'cost_price', 'demand_forecast', 'optimal_price'
-                ]):
-                    # Convert to proper types
-                    cleaned_item = {
-                        'current_price': float(item['current_price']),
-                        'cost_price': float(item['cost_price']),
-                        'demand_forecast': float(item['demand_forecast']),
-                        'optimal_price': float(item['optimal_price']),
-                        'stock_level': int(item.get('stock_level', 100)),
-                        'days_in_stock': int(item.get('days_in_stock', 30)),
-                        'seasonality_index': float(item.get('seasonality_index', 1.0)),
-                        'category_avg_price': float(item.get('category_avg_price', item['current_price'])),
-                        'competitor_prices': [
-                            float(p) for p in item.get('competitor_prices', [])
-                            if p is not None
-                        ] or [item['current_price']],
-                        'historical_sales': [
-                            float(s) for s in item.get('historical_sales', [])
-                            if s is not None
-                        ] or [100],
-                        'revenue_generated': float(item.get('revenue_generated', 
-                                                           item['optimal_price'] * item['demand_forecast']))
-                    }
-                    cleaned_data.append(cleaned_item)
-            except (ValueError, KeyError, TypeError) as e:
-                # Skip invalid items
-                continue
+        columns = {field: column(field) for field in REQUIRED_FIELDS + OPTIONAL_FIELDS}
+        columns['competitor_prices'] = matrix('competitor_prices')
+        columns['historical_sales'] = matrix('historical_sales')
+    
+    # Drop rows where any required field is missing
+    valid = np.all([np.isfinite(columns[field]) for field in REQUIRED_FIELDS], axis=0)
+    columns = {name: values[valid] for name, values in columns.items()}
+    
+    # Set defaults for optional fields
+    def fill(name, default):
+        columns[name] = np.where(np.isnan(columns[name]), default, columns[name])
+    
+    fill('stock_level', 100)
+    fill('days_in_stock', 30)
+    columns['stock_level'] = np.trunc(columns['stock_level'])
+    columns['days_in_stock'] = np.trunc(columns['days_in_stock'])
+    fill('seasonality_index', 1.0)
+    fill('category_avg_price', columns['current_price'])
+    fill('revenue_generated', columns['optimal_price'] * columns['demand_forecast'])
+    
+    return columns, n_total
+
+
+def base_model(incremental):
+    """A new model, or the saved one to refresh when training incrementally"""
+    model = SmartPricingModel()
+    if incremental and os.path.exists(MODEL_PATH):
+        model.load_model(MODEL_PATH)
+    return model
+
+
+def train_columnar(filepath, incremental=False):
+    """Train straight from columnar arrays, without building per-row dicts"""
+    columns, n_total = load_columnar(filepath)
+    n_valid = len(columns['current_price'])
+    
+    if n_valid < 10:
+        raise ValueError(f"Insufficient valid training samples. Need at least 10, got {n_valid}")
+    
+    model = base_model(incremental)
+    result = model.train_columns(columns, incremental=incremental)
+    
+    return model, result, n_valid, n_total
+
+
+def train_json(input_data):
+    """Validate and clean the JSON training set, then train"""
+    if not input_data:
+        raise ValueError("No input data received")
+    
+    # Parse JSON input
+    data = json.loads(input_data)
+    
+    if 'training_data' not in data or not data['training_data']:
+        raise ValueError("No training data provided")
+    
+    mode = data.get('mode', 'full')
+    if mode not in TRAINING_MODES:
+        raise ValueError(f"Unknown training mode: {mode}. Use one of {', '.join(TRAINING_MODES)}")
+    
+    training_data = data['training_data']
         
-        if len(cleaned_data) < 10:
-            raise ValueError(f"Insufficient valid training samples. Need at least 10, got {len(cleaned_data)}")
+    # Validate and clean training data
+    cleaned_data = []
+    for item in training_data:
+        try:
+            # Ensure all required fields exist and are not None
+            if all(key in item and item[key] is not None for key in [
+                'current_price', 'cost_price', 'demand_forecast', 'optimal_price'
+            ]):
+                # Convert to proper types
+                cleaned_item = {
+                    'current_price': float(item['current_price']),
+                    'cost_price': float(item['cost_price']),
+                    'demand_forecast': float(item['demand_forecast']),
+                    'optimal_price': float(item['optimal_price']),
+                    'stock_level': int(item.get('stock_level', 100)),
+                    'days_in_stock': int(item.get('days_in_stock', 30)),
+                    'seasonality_index': float(item.get('seasonality_index', 1.0)),
+                    'category_avg_price': float(item.get('category_avg_price', item['current_price'])),
+                    'competitor_prices': [
+                        float(p) for p in item.get('competitor_prices', [])
+                        if p is not None
+                    ] or [item['current_price']],
+                    'historical_sales': [
+                        float(s) for s in item.get('historical_sales', [])
+                        if s is not None
+                    ] or [100],
+                    'revenue_generated': float(item.get('revenue_generated', 
+                                                       item['optimal_price'] * item['demand_forecast']))
+                }
+                cleaned_data.append(cleaned_item)
+        except (ValueError, KeyError, TypeError) as e:
+            # Skip invalid items
+            continue
+    
+    if len(cleaned_data) < 10:
+        raise ValueError(f"Insufficient valid training samples. Need at least 10, got {len(cleaned_data)}")
+    
+    # Train model
+    model = base_model(mode == 'incremental')
+    result = model.train(cleaned_data, incremental=mode == 'incremental')
+    
+    return model, result, len(cleaned_data), len(training_data)
+
+
+def distill_saved_model():
+    """Distill the surrogate of the saved model from its training sample and save it"""
+    if not os.path.exists(MODEL_PATH):
+        raise ValueError("No trained model to distill. Train the model first.")
+    
+    model = SmartPricingModel()
+    model.load_model(MODEL_PATH)
+    model_version = model.model_version
+    report = model.fit_surrogate()
+    if report is None:
+        raise ValueError("The saved model has no training sample to distill from. Retrain it first.")
+    
+    # Training may have replaced the model meanwhile; its own distill step follows
+    if load_artifact(MODEL_PATH).get('model_version') != model_version:
+        return {'status': 'skipped', 'message': 'The model was retrained during distillation'}
+    
+    model.save_model(MODEL_PATH)
+    return {'status': 'success', 'message': 'Surrogate distilled', 'surrogate': report}
+
+
+def main():
+    try:
+        if '--distill' in sys.argv[1:]:
+            print(json.dumps(distill_saved_model()))
+            sys.exit(0)
         
-        # Train model
-        model = SmartPricingModel()
-        result = model.train(cleaned_data)
+        args = [arg for arg in sys.argv[1:] if arg != '--incremental']
+        if args:
+            model, result, n_valid, n_total = train_columnar(args[0], '--incremental' in sys.argv[1:])
+        else:
+            # Read input from stdin
+            input_data = sys.stdin.read()
+            request = json.loads(input_data) if input_data else None
+            if isinstance(request, dict) and request.get('distill'):
+                print(json.dumps(distill_saved_model()))
+                sys.exit(0)
+            model, result, n_valid, n_total = train_json(input_data)
         
         # Save model
-        model_path = os.path.join(os.path.dirname(__file__), 'pricing_model.pkl')
-        model.save_model(model_path)
+        model.save_model(MODEL_PATH)
         
         # Return success response
         response = {
             'status': 'success',
-            'message': f'Model trained with {len(cleaned_data)} samples',
-            'samples_processed': len(cleaned_data),
-            'samples_skipped': len(training_data) - len(cleaned_data),
-            'feature_importances': result.get('feature_importances', {})
+            'message': f'Model trained with {n_valid} samples',
+            'mode': result.get('mode', 'full'),
+            'n_trees': len(model.model.estimators_),
+            'samples_processed': n_valid,
+            'samples_skipped': n_total - n_valid,
+            'feature_importances': result.get('feature_importances', {}),
+            'surrogate_drift': result.get('surrogate_drift'),
+            'needs_distill': result.get('needs_distill', True)
         }
         
         print(json.dumps(response))
@@ -2,9 +2,90 @@ import Product from '../models/Product.js';
 import DemandForecast from '../models/DemandForecast.js';
 import DemandData from '../models/DemandData.js';
 // Import BOTH new functions from the service
-import { getAIDemandForecast, trainAIModel } from '../services/aiService.js';
+import { getAIDemandForecast, getAIDemandForecastBatch, trainAIModel } from '../services/aiService.js';
 import sequelize from '../config/database.js';
 
+export const MIN_HISTORY_DAYS = 30;
+const FORECAST_DAYS = 30;
+// Products per /predict/demand/batch request
+const CATALOGUE_BATCH_SIZE = 500;
+
+/**
+ * @desc Sales history of many products, read with one query
+ * @param {Array} products Product rows ({ id, category })
+ * @returns {{ seriesByProduct: Object, categories: Object }} keyed by product id
+ */
+export const loadCatalogueHistories = async (products) => {
+  const rows = await DemandData.findAll({
+    where: { productId: products.map(p => p.id) },
+    attributes: ['productId', 'date', 'quantity_sold'],
+    order: [['productId', 'ASC'], ['date', 'ASC']],
+    raw: true,
+  });
+
+  const seriesByProduct = Object.fromEntries(products.map(p => [p.id, []]));
+  for (const { productId, date, quantity_sold } of rows) {
+    seriesByProduct[productId].push({ date, quantity_sold });
+  }
+  const categories = Object.fromEntries(
+    products.filter(p => p.category).map(p => [p.id, p.category])
+  );
+  return { seriesByProduct, categories };
+};
+
+/**
+ * @desc Forecast and save demand for many products, CATALOGUE_BATCH_SIZE per AI request
+ * @param {Array} products Product rows ({ id, category })
+ * @param {string} model 'series' (last /train) or 'global' (/train/global)
+ * @param {Object} histories Optional loadCatalogueHistories() result for these products
+ * @returns {{ forecasted: number, errors: Object }} errors by product id
+ */
+export const forecastCatalogue = async (products, model = 'series', histories = null) => {
+  const { seriesByProduct, categories } = histories ?? await loadCatalogueHistories(products);
+
+  const errors = {};
+  const ready = [];
+  for (const [productId, history] of Object.entries(seriesByProduct)) {
+    if (history.length < MIN_HISTORY_DAYS) {
+      errors[productId] = `Not enough sales data. Need at least ${MIN_HISTORY_DAYS} days of history, found ${history.length}.`;
+    } else {
+      ready.push(productId);
+    }
+  }
+
+  let forecasted = 0;
+  for (let start = 0; start < ready.length; start += CATALOGUE_BATCH_SIZE) {
+    const chunk = ready.slice(start, start + CATALOGUE_BATCH_SIZE);
+    const aiResponse = await getAIDemandForecastBatch(
+      Object.fromEntries(chunk.map(id => [id, seriesByProduct[id]])),
+      FORECAST_DAYS,
+      model,
+      Object.fromEntries(chunk.filter(id => categories[id]).map(id => [id, categories[id]]))
+    );
+    if (!aiResponse.success) {
+      throw new Error('AI service returned an error during batch prediction');
+    }
+    Object.assign(errors, aiResponse.errors);
+
+    // Replace the saved forecasts of this chunk in one transaction
+    const productIds = Object.keys(aiResponse.forecasts);
+    const forecastData = productIds.flatMap(productId =>
+      aiResponse.forecasts[productId].map(item => ({
+        productId: Number(productId),
+        date: item.date,
+        predicted_quantity: Math.round(item.predicted_quantity),
+      }))
+    );
+    await sequelize.transaction(async (t) => {
+      await DemandForecast.destroy({ where: { productId: productIds }, transaction: t });
+      await DemandForecast.bulkCreate(forecastData, { transaction: t });
+    });
+    forecasted += productIds.length;
+  }
+
+  return { forecasted, errors };
+};
+
 // @desc    Generate a new demand forecast for a product
 // @route   POST /api/forecast/:productId
 // @access  Private
@@ -48,7 +129,7 @@ export const generateForecast = async (req, res) => {
 
     // 5. --- NEW STEP ---
     // Now, call predict. This will load the model we just saved.
-    const aiResponse = await getAIDemandForecast(historicalData, 30);
+    const aiResponse = await getAIDemandForecast(historicalData, 30, productId);
 
     if (!aiResponse.success) {
       throw new Error('AI service returned an error during prediction');
@@ -89,6 +170,46 @@ export const generateForecast = async (req, res) => {
   }
 };
 
+// @desc    Generate demand forecasts for all of the user's products
+// @route   POST /api/forecast/catalogue
+// @access  Private
+export const generateCatalogueForecast = async (req, res) => {
+  try {
+    const userId = req.user.id;
+    // 'series': the last /train model; 'global': the catalogue-wide model
+    const model = req.body?.model === 'global' ? 'global' : 'series';
+
+    const products = await Product.findAll({
+      where: { userId },
+      attributes: ['id', 'category'],
+      raw: true,
+    });
+
+    if (products.length === 0) {
+      return res.status(404).json({
+        success: false,
+        message: 'No products found',
+      });
+    }
+
+    const { forecasted, errors } = await forecastCatalogue(products, model);
+
+    res.status(201).json({
+      success: true,
+      message: `Forecasts generated for ${forecasted} of ${products.length} products.`,
+      data: { forecasted, errors },
+    });
+
+  } catch (error) {
+    console.error('Catalogue forecast error:', error);
+    res.status(500).json({
+      success: false,
+      message: 'Error generating catalogue forecast',
+      error: error.message,
+    });
+  }
+};
+
 // @desc    Get demand forecast for a product
 // @route   GET /api/forecast/:productId
 // @access  Private
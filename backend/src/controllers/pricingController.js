@@ -61,6 +61,96 @@ async function callPythonModel(scriptName, data) {
   });
 }
 
+// Helper: Long-lived pricing worker (predict_price.py --serve)
+// The model is loaded once by the worker and kept warm between requests.
+// Requests are newline-delimited JSON and answered in order, one line each.
+let pricingWorker = null;
+// A request not answered in time rejects and restarts the worker
+const PRICING_REQUEST_TIMEOUT_MS = Number(process.env.PRICING_REQUEST_TIMEOUT_MS || 60 * 1000);
+const PRICING_BATCH_TIMEOUT_MS = Number(process.env.PRICING_BATCH_TIMEOUT_MS || 15 * 60 * 1000);
+// Only the end of the worker's stderr is kept, for the exit error message
+const STDERR_TAIL_CHARS = 8192;
+
+function getPricingWorker() {
+  if (pricingWorker) return pricingWorker;
+
+  const pythonPath = process.env.PYTHON_PATH || 'python';
+  const scriptDir = path.join(__dirname, '../../ml_models');
+  const python = spawn(pythonPath, ['predict_price.py', '--serve'], { cwd: scriptDir });
+  const worker = { process: python, pending: [], buffer: '', errorData: '' };
+
+  python.stdout.on('data', (data) => {
+    worker.buffer += data.toString();
+    let newline;
+    while ((newline = worker.buffer.indexOf('\n')) >= 0) {
+      const line = worker.buffer.slice(0, newline);
+      worker.buffer = worker.buffer.slice(newline + 1);
+      const request = worker.pending.shift();
+      if (!request) continue;
+      clearTimeout(request.timer);
+      try {
+        const result = JSON.parse(line);
+        if (result.error) {
+          request.reject(new Error(`${result.type}: ${result.error}`));
+        } else {
+          request.resolve(result);
+        }
+      } catch (err) {
+        request.reject(new Error(`Failed to parse Python output: ${line}`));
+      }
+    }
+  });
+  python.stderr.on('data', (data) => {
+    worker.errorData = (worker.errorData + data.toString()).slice(-STDERR_TAIL_CHARS);
+  });
+
+  const shutdown = (err) => {
+    if (pricingWorker === worker) pricingWorker = null;
+    for (const request of worker.pending.splice(0)) {
+      clearTimeout(request.timer);
+      request.reject(err);
+    }
+  };
+  worker.restart = (err) => {
+    shutdown(err);
+    python.kill();
+  };
+  // Writing to a worker that has died fails with EPIPE here, not in write()
+  python.stdin.on('error', (err) => {
+    worker.restart(new Error(`Failed to write to Python process: ${err.message}`));
+  });
+  python.on('close', (code) => {
+    shutdown(new Error(`Pricing worker exited with code ${code}: ${worker.errorData}`));
+  });
+  python.on('error', (err) => {
+    shutdown(new Error(`Failed to spawn Python process: ${err.message}`));
+  });
+
+  pricingWorker = worker;
+  return worker;
+}
+
+// Helper: Get a price prediction from the warm pricing worker
+function callPricingWorker(data, timeoutMs = PRICING_REQUEST_TIMEOUT_MS) {
+  return new Promise((resolve, reject) => {
+    if (!data || typeof data !== 'object') {
+      reject(new Error('Invalid input data for Python model'));
+      return;
+    }
+    const worker = getPricingWorker();
+    const request = { resolve, reject };
+    request.timer = setTimeout(() => {
+      worker.restart(new Error(`Pricing worker did not answer within ${timeoutMs} ms`));
+    }, timeoutMs);
+    try {
+      worker.pending.push(request);
+      worker.process.stdin.write(JSON.stringify(data) + '\n');
+    } catch (err) {
+      worker.restart(new Error(`Failed to write to Python process: ${err.message}`));
+    }
+  });
+}
+
 // Helper: Safely parse float values
 function safeParseFloat(value, defaultValue = 0) {
   // ... (This function remains the same)
@@ -104,8 +194,7 @@ export const getPricingSuggestions = async (req, res) => {
     
     // Prepare data for ML model
     const suggestions = [];
-    
-    for (const product of products) {
+    const productDataList = products.map((product) => {
       // Get competitor prices for this product
       const productCompetitors = competitors.filter(c => c.productId === product.id);
       const competitorPrices = productCompetitors
@@ -123,7 +212,7 @@ export const getPricingSuggestions = async (req, res) => {
       );
       
       // Prepare product data for ML model
-      const productData = {
+      return {
         id: product.id,
         name: product.name,
         current_price: currentPrice,
@@ -139,10 +228,26 @@ export const getPricingSuggestions = async (req, res) => {
           ? product.demand.map(d => d.quantity_sold).reverse()
           : [100]
       };
+    });
+    
+    // Call Python ML model once for the whole catalogue
+    // (vectorized grid optimizer instead of one gp_minimize run per product)
+    let batchResults;
+    try {
+      const batch = await callPricingWorker({ products: productDataList, optimizer: 'grid' }, PRICING_BATCH_TIMEOUT_MS);
+      batchResults = batch.predictions;
+    } catch (mlError) {
+      batchResults = productDataList.map(() => ({ error: mlError.message, type: 'Error' }));
+    }
+    
+    for (const [index, product] of products.entries()) {
+      const productData = productDataList[index];
       
       try {
-        // Call Python ML model for prediction
-        const prediction = await callPythonModel('predict_price.py', productData);
+        const prediction = batchResults[index];
+        if (prediction.error) {
+          throw new Error(`${prediction.type}: ${prediction.error}`);
+        }
         
         // Store or update suggestion in database
         await PricingSuggestion.upsert({
@@ -260,6 +365,7 @@ export const getProductPricing = async (req, res) => {
     const costPrice = safeParseFloat(product.costPrice, currentPrice * 0.6);
     
     const productData = {
+      id: product.id,
       current_price: currentPrice,
       cost_price: costPrice,
       // ❗ FIX: Get forecast from the most recent 'demand' entry
@@ -275,8 +381,8 @@ export const getProductPricing = async (req, res) => {
         : [100]
     };
     
-    // Get ML prediction
-    const prediction = await callPythonModel('predict_price.py', productData);
+    // Get ML prediction (interactive request: distilled surrogate of the forest)
+    const prediction = await callPricingWorker({ ...productData, mode: 'fast' });
     
     // Save suggestion
     await PricingSuggestion.upsert({
@@ -509,11 +615,21 @@ export const retrainModel = async (req, res) => {
       });
     }
     
-    // Call Python training script
+    // Call Python training script. By default the recent suggestions refresh
+    // the current forest (new trees, oldest retired); { mode: 'full' } rebuilds it
     const result = await callPythonModel('train_model.py', {
-      training_data: formattedData
+      training_data: formattedData,
+      mode: req.body?.mode === 'full' ? 'full' : 'incremental'
     });
     
+    // Distill the fast-mode surrogate off the request path when the new
+    // forest needs one (full training, or an incremental fit that drifted
+    // from the kept surrogate)
+    if (result.needs_distill) {
+      callPythonModel('train_model.py', { distill: true })
+        .catch(err => console.error('Surrogate distillation error:', err));
+    }
+    
     res.json({
       success: true,
       message: 'Model retrained successfully',
@@ -0,0 +1,55 @@
+import Product from '../models/Product.js';
+import { MIN_HISTORY_DAYS, loadCatalogueHistories, forecastCatalogue } from '../controllers/forecastController.js';
+import { trainAIGlobalModel } from '../services/aiService.js';
+
+// Local hour the job runs at; NIGHTLY_DEMAND_JOB=off disables it
+const NIGHTLY_JOB_HOUR = Number(process.env.NIGHTLY_JOB_HOUR ?? 2);
+
+const msUntilNextRun = () => {
+  const now = new Date();
+  const next = new Date(now);
+  next.setHours(NIGHTLY_JOB_HOUR, 0, 0, 0);
+  if (next <= now) next.setDate(next.getDate() + 1);
+  return next - now;
+};
+
+/**
+ * @desc Retrain the global demand model on every product with enough history,
+ * then refresh the saved forecasts of the whole catalogue with it
+ */
+export const runNightlyDemandJob = async () => {
+  const products = await Product.findAll({ attributes: ['id', 'category'], raw: true });
+  const histories = await loadCatalogueHistories(products);
+
+  const trainable = Object.fromEntries(
+    Object.entries(histories.seriesByProduct).filter(([, history]) => history.length >= MIN_HISTORY_DAYS)
+  );
+  if (Object.keys(trainable).length === 0) {
+    console.log('Nightly demand job: no product has enough sales history, skipped');
+    return;
+  }
+
+  const training = await trainAIGlobalModel(trainable, histories.categories);
+  const { forecasted, errors } = await forecastCatalogue(products, 'global', histories);
+  console.log(
+    `Nightly demand job: global model trained on ${training.products_trained} products, ` +
+    `${forecasted} forecasts saved, ${Object.keys(errors).length} skipped`
+  );
+};
+
+/**
+ * @desc Run runNightlyDemandJob every night at NIGHTLY_JOB_HOUR
+ */
+export const scheduleNightlyDemandJob = () => {
+  if (process.env.NIGHTLY_DEMAND_JOB === 'off') return;
+
+  const run = async () => {
+    try {
+      await runNightlyDemandJob();
+    } catch (error) {
+      console.error('Nightly demand job error:', error.message);
+    }
+    setTimeout(run, msUntilNextRun());
+  };
+  setTimeout(run, msUntilNextRun());
+};
@@ -1,5 +1,5 @@
 import express from 'express';
-import { generateForecast, getForecast }from '../controllers/forecastController.js';
+import { generateForecast, generateCatalogueForecast, getForecast }from '../controllers/forecastController.js';
 import { protect } from '../middleware/auth.js';
 
 const router = express.Router();
@@ -7,6 +7,9 @@ const router = express.Router();
 // All routes are protected
 router.use(protect); // This comes from your src/middleware/auth.js
 
+// Forecast every product of the user with batched AI requests
+router.post('/catalogue', generateCatalogueForecast);
+
 router.route('/:productId')
   .post(generateForecast) // Generate a new forecast
   .get(getForecast);      // Get the saved forecast
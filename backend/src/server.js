@@ -12,6 +12,7 @@ import forecastRoutes from "./routes/forecast.js";
 import pricingroutes from "./routes/pricingRules.js"; 
 import pricingRoutes from './routes/pricing.js';
 import promoRoutes from './routes/promo.js';
+import { scheduleNightlyDemandJob } from './jobs/nightlyDemandJob.js';
 
 
 
@@ -72,6 +73,8 @@ app.get("/", (req, res) => res.send("Backend running ✅"));
 
 const PORT = process.env.PORT || 4000;
 app.listen(PORT, () => console.log(`🚀 Server running on port ${PORT}`));
+// Nightly: retrain the global demand model and refresh all forecasts with it
+scheduleNightlyDemandJob();
 await ProductReview.sync();
 await PromoCampaign.sync();
 await PromoSimulation.sync();
\ No newline at end of file
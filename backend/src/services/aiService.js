@@ -1,6 +1,43 @@
 import axios from 'axios';
 
 const AI_API_URL = 'http://localhost:5001'; 
+const TRAIN_POLL_INTERVAL_MS = 2000;
+const TRAIN_TIMEOUT_MS = 30 * 60 * 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * @desc Poll /train/:jobId until the training job finishes
+ * @param {string} jobId The id returned when the job was queued
+ * @returns The job result ({ message, fit_seconds, ... })
+ */
+const waitForTrainingJob = async (jobId) => {
+  const deadline = Date.now() + TRAIN_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const { data } = await axios.get(`${AI_API_URL}/train/${jobId}`);
+    if (data.job.status === 'done') return data.job.result;
+    if (data.job.status === 'failed') throw new Error(data.job.error);
+    await sleep(TRAIN_POLL_INTERVAL_MS);
+  }
+  throw new Error(`Training job ${jobId} did not finish in time`);
+};
+
+/**
+ * @desc Queue a training job and wait for it. If a job for the same models
+ * is already running, wait for that one first and then queue ours.
+ */
+const runTrainingJob = async (route, body) => {
+  for (;;) {
+    try {
+      const response = await axios.post(`${AI_API_URL}${route}`, body);
+      const result = await waitForTrainingJob(response.data.job_id);
+      return { success: true, job_id: response.data.job_id, ...result };
+    } catch (error) {
+      if (!(error.response && error.response.status === 409)) throw error;
+      await waitForTrainingJob(error.response.data.job_id).catch(() => {});
+    }
+  }
+};
 
 /**
  * @desc Tell the AI server to train and save a new model
@@ -8,28 +45,47 @@ const AI_API_URL = 'http://localhost:5001';
  */
 export const trainAIModel = async (historicalData) => {
   try {
-    // This calls your new /train route
-    const response = await axios.post(`${AI_API_URL}/train`, {
+    // This calls your new /train route (a background job) and waits for it
+    return await runTrainingJob('/train', {
       historical_data: historicalData,
-    });
-    return response.data; // Returns { success: true, message: ... }
+    }); // Returns { success: true, message: ... }
   } catch (error) {
     console.error('Error calling AI train service:', error.message);
     throw new Error('Could not train AI model');
   }
 };
 
+/**
+ * @desc Train the global demand models over many products at once (e.g. nightly)
+ * @param {Object} seriesByProduct { productId: historicalData } for each product
+ * @param {Object} categories { productId: category } used as a model feature
+ */
+export const trainAIGlobalModel = async (seriesByProduct, categories = {}) => {
+  try {
+    // This calls the /train/global route (a background job) and waits for it
+    return await runTrainingJob('/train/global', {
+      products: seriesByProduct,
+      categories,
+    }); // Returns { success, products_trained, skipped: { productId: message } }
+  } catch (error) {
+    console.error('Error calling AI global train service:', error.message);
+    throw new Error('Could not train global AI model');
+  }
+};
+
 /**
  * @desc Get a demand forecast from the AI server
  * @param {Array} historicalData The user's real sales data (for feature creation)
  * @param {number} days The number of days to forecast
+ * @param {string|number} productId Optional; lets the AI server reuse its stored features for this product
  */
-export const getAIDemandForecast = async (historicalData, days = 30) => {
+export const getAIDemandForecast = async (historicalData, days = 30, productId = null) => {
   try {
     // This calls your /predict/demand route
     const response = await axios.post(`${AI_API_URL}/predict/demand`, {
       historical_data: historicalData,
       days_to_forecast: days,
+      ...(productId !== null && { product_id: String(productId), feature_store: true }),
     });
     return response.data; // Returns { success, forecast: [...] }
   } catch (error) {
@@ -42,4 +98,50 @@ export const getAIDemandForecast = async (historicalData, days = 30) => {
     console.error('Error calling AI forecast service:', aiErrorMessage);
     throw new Error(aiErrorMessage);
   }
-};
\ No newline at end of file
+};
+
+/**
+ * @desc Make the AI server rebuild its stored features for these products
+ * Call this after correcting past sales; new days are picked up on their own.
+ * @param {Array} productIds Ids whose sales history was edited
+ */
+export const invalidateAIFeatureState = async (productIds) => {
+  try {
+    const response = await axios.post(`${AI_API_URL}/features/invalidate`, {
+      product_ids: productIds.map(String),
+    });
+    return response.data; // Returns { success, invalidated }
+  } catch (error) {
+    console.error('Error calling AI feature invalidation:', error.message);
+    throw new Error('Could not invalidate AI feature state');
+  }
+};
+
+/**
+ * @desc Get demand forecasts for many products in one request
+ * @param {Object} seriesByProduct { productId: historicalData } for each product
+ * @param {number} days The number of days to forecast
+ * @param {string} model 'series' (last /train) or 'global' (/train/global)
+ * @param {Object} categories { productId: category }, used by the global model
+ */
+export const getAIDemandForecastBatch = async (seriesByProduct, days = 30, model = 'series', categories = {}) => {
+  try {
+    // This calls the /predict/demand/batch route
+    const response = await axios.post(`${AI_API_URL}/predict/demand/batch`, {
+      products: seriesByProduct,
+      days_to_forecast: days,
+      model,
+      categories,
+    });
+    return response.data; // Returns { success, forecasts: { productId: [...] }, errors: { productId: message } }
+  } catch (error) {
+    let aiErrorMessage = 'Could not get batch prediction from AI server';
+    if (error.response && error.response.data && error.response.data.message) {
+      aiErrorMessage = `AI Error: ${error.response.data.message}`;
+    } else if (error.message) {
+      aiErrorMessage = error.message;
+    }
+    console.error('Error calling AI batch forecast service:', aiErrorMessage);
+    throw new Error(aiErrorMessage);
+  }
+};